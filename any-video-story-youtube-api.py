@@ -3,24 +3,28 @@ import openai
 import time
 import os
 import uuid
-from elevenlabs import VoiceSettings
-from elevenlabs.client import ElevenLabs
-import requests
-import json
+import http_pool
 import re
-from pydub import AudioSegment
-from moviepy.editor import *
-import googleapiclient.discovery
 import yt_dlp
-import boto3
+from youtube_cache import broll_options, broll_span, cached_download, cached_search, youtube_client
+import s3_transfer
 import nltk
 from nltk.corpus import stopwords
 from collections import Counter
+from job_queue import JobQueue, register_job_routes, run_or_submit
+from workspace import Workspace
+from ffmpeg_render import render_broll_timeline
+from tts_client import synthesize
+from llm_cache import chat_completion, register_cache_bypass
 
 nltk.download("stopwords")
 stop_words = set(stopwords.words("english"))
 
 app = Flask(__name__)
+jobs = JobQueue()
+register_job_routes(app, jobs)
+register_cache_bypass(app)
+http_pool.register_http_stats_route(app)
 
 # Retrieve API keys from environment variables
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -36,34 +40,16 @@ external_ip = os.getenv("EXTERNAL_IP")
 # Initialize OpenAI client
 client = openai.OpenAI()
 
-# S3 client initialization
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key,
-    region_name=aws_region
-)
-
-
-def upload_to_s3(file_path, unique_id):
-    s3_key = f"videos/{unique_id}.mp4"
-    try:
-        s3_client.upload_file(file_path, s3_bucket_name, s3_key)
-        s3_url = f"https://{s3_bucket_name}.s3.{aws_region}.amazonaws.com/{s3_key}"
-        return s3_url
-    except Exception as e:
-        print(f"Error uploading to S3: {str(e)}")
-        return None
         
 def generate_text(topic, num_frames):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+      client,
       model="gpt-4o-mini",
       messages=[
         {"role": "system", "content": "You are a super creative non-fiction story writer"},
         {"role": "user", "content": "Your job is to generate "+ str(num_frames) + " single-line sentences which will be used in a voiceover about the topic "+ str(topic)+ ". Please give a numbered list only like 1. 2. 3. and so on."}
       ]
     )
-    response = completion.choices[0].message.content
     # Extract sentences from the response
     sentences = re.split(r'\d+\.\s', response)[1:]  # Split by numbered list, and ignore the first empty element
     # Clean up sentences by removing any newline characters
@@ -71,85 +57,23 @@ def generate_text(topic, num_frames):
     return cleaned_sentences
     
 def extract_subject(text):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+      client,
       model="gpt-4o-mini",
       messages=[
         {"role": "system", "content": "You only return subject of the sentence"},
         {"role": "user", "content": f"You simply return the subject of the sentence {text} and nothing else"}
       ]
     )
-    response = completion.choices[0].message.content
     return response
     
 
-def submit_text(generated_text):
-    url = "https://api.elevenlabs.io/v1/text-to-speech/TlLWC5O5AUzxAg7ysFZB"
-    headers = {
-        "Content-Type": "application/json",
-        "xi-api-key": api_key
-    }
-    data = {
-        "text": generated_text,
-        "voice_settings": {
-            "stability": 0.1,
-            "similarity_boost": 0
-        }
-    }
-
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    
-    if response.status_code == 200:
-        print("Successfully submitted to elevenlabs")
-    else:
-        print(f"Error {response.status_code}: {response.content}")
-
-def get_history_item_id():
-    client = ElevenLabs(
-        api_key=api_key,
-    )
-    resp = client.history.get_all(
-        page_size=1,
-        voice_id="TlLWC5O5AUzxAg7ysFZB",
-    )
-    history_item_id = resp.history[0].history_item_id
-    return history_item_id
-
-def create_audiofile(history_item_id, unique_id):
-    output_folder = "generated_audio"
-    client = ElevenLabs(
-        api_key=api_key,
-    )
-    
-    # Getting the audio generator
-    audio_generator = client.history.get_audio(
-        history_item_id=str(history_item_id),
-    )
-    
-    # Filename with unique_id
-    filename = f"{unique_id}.mp3"
-    
-    # Full path to save the file
-    file_path = os.path.join(output_folder, filename)
-    
-    # Ensure the output folder exists
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    
-    # Saving the audio data to a file
-    with open(file_path, "wb") as audio_file:
-        for chunk in audio_generator:
-            audio_file.write(chunk)
-
-    # Load the saved audio file to get its duration
-    audio = AudioSegment.from_file(file_path)
-    duration = len(audio) / 1000  # Duration in seconds
-
-    print(f"{file_path} saved successfully, duration: {duration} seconds")
-    
-    return duration
+# Create the voiceover for one line of text, named after unique_id
+def create_audiofile(text, unique_id, workspace):
+    return synthesize(text, workspace.path("generated_audio", f"{unique_id}.mp3"))
 
 def youtube_search(query, max_results=5):
-    youtube = googleapiclient.discovery.build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+    youtube = youtube_client(YOUTUBE_API_KEY)
 
     # Search for YouTube videos matching the query and return only videos less than 60 seconds long
     request = youtube.search().list(
@@ -182,100 +106,110 @@ def youtube_search(query, max_results=5):
 
     return video_links
 
-def download_video(url, output_folder, unique_id):
+def download_video(url, output_folder, unique_id, seconds=None):
     try:
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
         
-        # Adjusting yt-dlp options to download any available format and not fail
+        # yt-dlp options: the first `seconds` of the video, capped at our output height
         ydl_opts = {
-            'format': 'mp4',  # Download any available mp4 format
+            **broll_options(seconds),  # Only the span we use, at most BROLL_MAX_HEIGHT
             'outtmpl': os.path.join(output_folder, f'{unique_id}.%(ext)s'),  # Save video with unique_id
             'ignoreerrors': True,  # Ignore any errors and continue
-            'merge_output_format': 'mp4',  # Ensure output is mp4
         }
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            info = ydl.extract_info(url, download=True)
+            if not info:
+                print(f"Failed to download video from: {url}")
+                return None
+            file_path = ydl.prepare_filename(info)
         
         print(f"Downloaded video from: {url}")
+        return file_path
     
     except Exception as e:
         print(f"Error downloading video: {str(e)}")
+        return None
 
 
-def search_and_download(query, max_results=1, output_folder="downloaded_videos", unique_id=None):
-    video_urls = youtube_search(query, max_results)
+# Return the path of the first search result that downloads successfully
+def search_and_download(query, output_folder, max_results=1, unique_id=None, seconds=None):
+    # Known queries and clips come from local disk without touching YouTube
+    video_urls = cached_search(query, max_results, youtube_search)
     for url in video_urls:
-        download_video(url, output_folder, unique_id)
+        file_path = cached_download(url, output_folder, unique_id, download_video, seconds)
+        if file_path and os.path.exists(file_path):
+            return file_path
+    return None
 
-def download_video_for_text(text, unique_id):
+# Fetch B-roll for text, just long enough to cover `duration` seconds of narration
+def download_video_for_text(text, unique_id, workspace, duration):
     keyword = extract_subject(text)
     print("The keyword is ", keyword)
-    search_and_download(keyword, max_results=1, output_folder="downloaded_videos", unique_id=unique_id)
-
-def create_video(clip_info):
-    audio_folder = "generated_audio"
-    video_folder = "downloaded_videos"
-    output_folder = "generated_video"
-
-    # Ensure the output folder exists
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    return search_and_download(keyword, workspace.folder("downloaded_videos"), max_results=1, unique_id=unique_id,
+                               seconds=broll_span(duration))
 
+def create_video(clip_info, output_path):
     clips = []
-
     for info in clip_info:
-        unique_id = info['unique_id']
-        duration = info['duration']
-
-        audio_file = os.path.join(audio_folder, f"{unique_id}.mp3")
-        video_file = None
-
-        # Find the video file with matching unique_id
-        for file in os.listdir(video_folder):
-            if file.startswith(unique_id):
-                video_file = os.path.join(video_folder, file)
-                break
-
-        if video_file is None:
-            print(f"No video file found for {unique_id}")
+        if info['video_path'] is None:
+            print(f"No video file found for {info['unique_id']}")
             continue
+        clips.append(info)
 
-        # Load the audio clip
-        audio_clip = AudioFileClip(audio_file)
-
-        # Load the video clip
-        video_clip = VideoFileClip(video_file)
-
-        # If video is longer than audio, trim it
-        if video_clip.duration > audio_clip.duration:
-            video_clip = video_clip.subclip(0, audio_clip.duration)
-        # If video is shorter than audio, extend it
-        elif video_clip.duration < audio_clip.duration:
-            # Calculate how much time to add
-            time_to_add = audio_clip.duration - video_clip.duration
-            # Freeze the last frame
-            last_frame = video_clip.to_ImageClip(duration=time_to_add)
-            video_clip = concatenate_videoclips([video_clip, last_frame])
-        # Else, durations are equal, do nothing
-
-        # Set the audio of the video clip to be the audio clip
-        video_clip = video_clip.set_audio(audio_clip)
+    # Each clip is cut or frozen to its narration in its own ffmpeg process,
+    # then the segments are joined with a stream copy
+    render_broll_timeline(clips, output_path)
 
-        # Ensure the video clip duration matches the audio duration exactly
-        video_clip = video_clip.set_duration(audio_clip.duration)
-
-        clips.append(video_clip)
+    print(f"Video saved as {output_path}")
+    return output_path
 
-    # Concatenate all clips
-    final_clip = concatenate_videoclips(clips, method='compose')
 
-    # Write the result to a file
-    output_path = os.path.join(output_folder, "final_video.mp4")
-    final_clip.write_videofile(output_path, fps=24, codec='libx264', audio_codec='aac')
+# Full video-story pipeline, returns (payload, http_status)
+def run_video_story(topic, num_frames):
+    # Scratch files live in a per-request workspace that is removed afterwards
+    with Workspace("video-story") as workspace:
+        # Main execution
+        generated_array = generate_text(topic, num_frames)
+    
+        clip_info = []
+    
+        for text in generated_array:
+            unique_id = str(uuid.uuid4())
+            audio_path, duration = create_audiofile(text, unique_id, workspace)
+            video_path = download_video_for_text(text, unique_id, workspace, duration)
+            clip_info.append({
+                'unique_id': unique_id,
+                'audio_path': audio_path,
+                'video_path': video_path,
+                'duration': duration
+            })
+
+        # Create the video and upload it to S3 under a per-request key
+        s3_url = s3_transfer.upload_while_writing(
+            lambda output_path: create_video(clip_info, output_path),
+            workspace.path("generated_video", "final_video.mp4"), s3_bucket_name, f"videos/{uuid.uuid4()}.mp4"
+        )
 
-    print(f"Video saved as {output_path}")
+        if s3_url:
+            # Send the S3 URL to the external endpoint
+            response = http_pool.post(
+                f"http://{external_ip}:7020/caption_video",
+                headers={"Content-Type": "application/json"},
+                json={"video_url": s3_url},
+                timeout=http_pool.SERVICE_TIMEOUT
+            )
+
+
+            # Get the returned video URL from the response
+            if response.status_code == 200:
+                captioned_video_url = response.json().get("video_url")
+                return {"video_url": captioned_video_url}, 200
+            else:
+                return {"error": "Failed to send video to caption endpoint"}, 500
+        else:
+            return {'error': 'Failed to upload video to S3'}, 500
 
 
 @app.route('/video-story', methods=['POST'])
@@ -292,47 +226,8 @@ def video_story():
     except ValueError:
         return jsonify({'error': 'num_frames must be an integer'}), 400
 
-    # Main execution
-    generated_array = generate_text(topic, num_frames)
-    
-    clip_info = []
-    
-    for text in generated_array:
-        unique_id = str(uuid.uuid4())
-        submit_text(text)
-        history_id = get_history_item_id()
-        duration = create_audiofile(history_id, unique_id)
-        download_video_for_text(text, unique_id)
-        clip_info.append({
-            'unique_id': unique_id,
-            'duration': duration
-        })
-
-    # Create the video
-    create_video(clip_info)
-
-    # Path to the generated video
-    video_file_path = os.path.join("generated_video", "final_video.mp4")
-    
-    # Upload the video to S3 and get the URL
-    s3_url = upload_to_s3(video_file_path, "final_video")
-
-    if s3_url:
-        # Send the S3 URL to the external endpoint
-        response = requests.post(
-            f"http://{external_ip}:7020/caption_video",
-            headers={"Content-Type": "application/json"},
-            json={"video_url": s3_url}
-        )
-
+    # Pass "async": true to get a job id back instead of waiting for the video
+    return run_or_submit(jobs, data, run_video_story, topic, num_frames)
 
-        # Get the returned video URL from the response
-        if response.status_code == 200:
-            captioned_video_url = response.json().get("video_url")
-            return jsonify({"video_url": captioned_video_url}), 200
-        else:
-            return jsonify({"error": "Failed to send video to caption endpoint"}), 500
-
-        
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=7004)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Persistent caches live here unless a path of their own is configured
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "all_apis"))
+
+
+# Hash of everything that determines an asset, e.g. asset_key(voice_id=..., text=...)
+def asset_key(**parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Put a stored file at target_path, as a hard link when possible and else as a copy.
+# Writers must replace target_path rather than write into it, or the stored copy changes too.
+def place_file(path, target_path):
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    if os.path.exists(target_path):
+        os.remove(target_path)
+    try:
+        os.link(path, target_path)
+    except OSError:
+        shutil.copyfile(path, target_path)
+    return target_path
+
+
+# Content-addressed files on local disk with a SQLite index, shared by every
+# service on the machine. Files are looked up by key, carry a small JSON dict of
+# metadata (e.g. a probed duration), and the least recently used ones are evicted
+# once the store grows past max_bytes or an entry is older than ttl seconds.
+class AssetStore:
+    def __init__(self, name, max_bytes, ttl=None, root=None):
+        self.root = root or os.path.join(CACHE_DIR, name)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.index_path = os.path.join(self.root, "index.sqlite3")
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    @contextmanager
+    def _index(self):
+        connection = sqlite3.connect(self.index_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS assets ("
+                    " key TEXT PRIMARY KEY, path TEXT, size INTEGER, meta TEXT,"
+                    " created_at REAL, last_used_at REAL)"
+                )
+                yield connection
+        finally:
+            connection.close()
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    # Return (path, meta) for a stored asset, or None
+    def get(self, key):
+        with self._index() as index:
+            row = index.execute("SELECT path, meta, created_at FROM assets WHERE key = ?", (key,)).fetchone()
+            if row and (not os.path.exists(row[0]) or (self.ttl and time.time() - row[2] > self.ttl)):
+                index.execute("DELETE FROM assets WHERE key = ?", (key,))
+                self._remove_file(row[0])
+                row = None
+            if row:
+                index.execute("UPDATE assets SET last_used_at = ? WHERE key = ?", (time.time(), key))
+
+        self._count(row is not None)
+        if not row:
+            return None
+        return row[0], json.loads(row[1] or "{}")
+
+    # Place a stored asset at target_path (hard link when possible, else a copy), return its meta or None
+    def fetch(self, key, target_path):
+        found = self.get(key)
+        if not found:
+            return None
+        path, meta = found
+        place_file(path, target_path)
+        return meta
+
+    # Add a finished file to the store under key and return the stored path
+    def put(self, key, source_path, meta=None):
+        suffix = os.path.splitext(source_path)[1]
+        stored_path = os.path.join(self.root, key[:2], key + suffix)
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+
+        # Link or copy to a temp name first so readers never see a half-written file
+        temp_path = f"{stored_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, stored_path)
+
+        self._record(key, stored_path, meta)
+        return stored_path
+
+    # Store raw bytes under key and return the stored path
+    def put_bytes(self, key, data, suffix, meta=None):
+        stored_path = os.path.join(self.root, key[:2], key + suffix)
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+
+        temp_path = f"{stored_path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "wb") as stored_file:
+            stored_file.write(data)
+        os.replace(temp_path, stored_path)
+
+        self._record(key, stored_path, meta)
+        return stored_path
+
+    def _record(self, key, stored_path, meta):
+        now = time.time()
+        with self._index() as index:
+            index.execute(
+                "INSERT OR REPLACE INTO assets (key, path, size, meta, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stored_path, os.path.getsize(stored_path), json.dumps(meta or {}), now, now)
+            )
+        self.evict()
+
+    # Drop least recently used assets until the store fits in max_bytes
+    def evict(self):
+        with self._index() as index:
+            total = index.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, path, size in index.execute("SELECT key, path, size FROM assets ORDER BY last_used_at").fetchall():
+                if total <= self.max_bytes:
+                    break
+                index.execute("DELETE FROM assets WHERE key = ?", (key,))
+                self._remove_file(path)
+                total -= size
+                print(f"Evicted {path} from {self.root}")
+
+    # Forget key and remove its file, e.g. when the file turned out to be unreadable
+    def delete(self, key):
+        with self._index() as index:
+            row = index.execute("SELECT path FROM assets WHERE key = ?", (key,)).fetchone()
+            index.execute("DELETE FROM assets WHERE key = ?", (key,))
+        if row:
+            self._remove_file(row[0])
+
+    def _remove_file(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        with self._index() as index:
+            entries, total = index.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM assets").fetchone()
+        return {"entries": entries, "bytes": total, "hits": self.hits, "misses": self.misses}
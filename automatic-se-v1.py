@@ -1,14 +1,13 @@
 import os
-import boto3
+import s3_transfer
 from moviepy.editor import VideoFileClip
 import openai
 import json
-from elevenlabs import ElevenLabs
+from sound_effects import sound_effect
 from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
+from llm_cache import chat_completion
 
 
-elevenlabs = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
-
 # Load environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
 aws_secret_key = os.getenv("AWS_SECRET_KEY")
@@ -17,25 +16,14 @@ aws_region = os.getenv("AWS_REGION", "eu-north-1")
 
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
-elevenlabs = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
 
 # Initialize the OpenAI client
 client = openai.OpenAI(api_key=openai_api_key)
 
-
-# AWS S3 configuration
-s3_client = boto3.client(
-    "s3",
-    region_name=aws_region,
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
-)
-
 # Function to download a video from S3
 def download_video_from_s3(s3_url, output_path):
-    bucket_name = s3_url.split('/')[2].split('.')[0]  # Extract bucket name from URL
-    key = '/'.join(s3_url.split('/')[3:])  # Extract object key
-    s3_client.download_file(bucket_name, key, output_path)
+    bucket_name, key = s3_transfer.parse_url(s3_url)
+    s3_transfer.download_file(bucket_name, key, output_path)
 
 # Function to extract audio from video and save as MP3
 def extract_audio(video_path, output_folder):
@@ -64,18 +52,26 @@ def speech_to_text(mp3_path):
     print("The transciption text is", transcription.text)
     return transcription  # Return the full transcription for further processing
 
+# Parse the model's {'word': 'time'} answer. Anything else raises, so it is never cached.
+def parse_se_object(text):
+    se_dict = json.loads(text.replace("'", '"'))
+    if not isinstance(se_dict, dict):
+        raise ValueError(f"Expected word -> timestamp pairs, got: {text}")
+    return se_dict
+
 def create_se_object(transcription_text):
 
     
-        completion = client.chat.completions.create(
+        response = chat_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "The words you give will be used in a text to sound effects model"},
                 {"role": "user", "content": f"Your job is to extract the word and the respective time stamp from {transcription_text} which have a very distinct sound associated with the word.  Limit the list to a maximum of 5-7 highly relevant words. Please give your response in this format" + " - {'word1': 'time1', 'word2': 'time2'} and so on. Please dont include any other text in the response. "
                 }
-            ]
+            ],
+            parse=parse_se_object
         )
-        response = completion.choices[0].message.content
         print("The Sound effects object is ", response)
 
         
@@ -88,17 +84,8 @@ def generate_sound_effect(text):
     os.makedirs(folder_path, exist_ok=True)
     output_path = os.path.join(folder_path, output_path)
     
-    print("Generating sound effects...")
-    result = elevenlabs.text_to_sound_effects.convert(
-        text=text,
-        duration_seconds=1,
-        prompt_influence=0.3,
-    )
-
-    with open(output_path, "wb") as f:
-        for chunk in result:
-            f.write(chunk)
-    print(f"Audio saved to {output_path}")
+    # Reused from the sound effect library when this effect was made before
+    sound_effect(text, output_path, duration_seconds=1, prompt_influence=0.3)
     
 
 
@@ -122,9 +109,8 @@ def insert_sound_effects_from_s3(s3_url, se_object, sound_effects_folder, output
     """
     try:
         # Download the video from S3
-        bucket_name = s3_url.split('/')[2].split('.')[0]  # Extract bucket name from URL
-        key = '/'.join(s3_url.split('/')[3:])  # Extract object key
-        s3_client.download_file(bucket_name, key, temp_video_path)
+        bucket_name, key = s3_transfer.parse_url(s3_url)
+        s3_transfer.download_file(bucket_name, key, temp_video_path)
         print(f"Video downloaded from S3 and saved to {temp_video_path}")
 
         # Load the downloaded video
@@ -202,8 +188,7 @@ def main():
         #Creating Transcription
         transcription = speech_to_text("/Users/amir/Desktop/all_apis/lib/python3.12/site-packages/extract_video_se/temp_video.mp3")
         print("Transcription Created")
-        se_object = create_se_object(transcription.text)
-        se_dict = json.loads(se_object.replace("'", '"'))  # Ensure valid JSON format
+        se_dict = create_se_object(transcription.text)
         
         for word in se_dict.keys():
             generate_sound_effect(str(word))
@@ -1,18 +1,30 @@
 #Use moviepy version - pip install moviepy==1.0.3
 import os
-import boto3
+import s3_transfer
 from flask import Flask, request, jsonify
 from moviepy.editor import VideoFileClip, AudioFileClip, CompositeAudioClip
 import openai
 import json
-from elevenlabs import ElevenLabs
 import uuid
+from job_queue import JobQueue, register_job_routes, run_or_submit
+from workspace import Workspace
+import http_pool
+from llm_cache import chat_completion, register_cache_bypass
+from sound_effects import prewarm_in_background, sound_effect
 
 # Initialize Flask app
 app = Flask(__name__)
-
-# Initialize ElevenLabs
-elevenlabs = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+jobs = JobQueue()
+register_job_routes(app, jobs)
+register_cache_bypass(app)
+http_pool.register_http_stats_route(app)
+
+# Keywords that come up in most videos are synthesized once at startup
+COMMON_SOUND_EFFECT_WORDS = os.getenv(
+    "COMMON_SOUND_EFFECT_WORDS",
+    "thunder,explosion,rain,wind,applause,laughter,footsteps,heartbeat,door,bell"
+).split(",")
+prewarm_in_background((word, 1, 0.3) for word in COMMON_SOUND_EFFECT_WORDS if word.strip())
 
 # Load environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -23,26 +35,15 @@ aws_region = os.getenv("AWS_REGION", "eu-north-1")
 # Initialize OpenAI client
 openai_api_key = os.getenv("OPENAI_API_KEY")
 client = openai.OpenAI(api_key=openai_api_key)
-
-# AWS S3 configuration
-s3_client = boto3.client(
-    "s3",
-    region_name=aws_region,
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
-)
-
 # Function to download a video from S3
 def download_video_from_s3(s3_url, output_path):
-    bucket_name = s3_url.split('/')[2].split('.')[0]  # Extract bucket name from URL
-    key = '/'.join(s3_url.split('/')[3:])  # Extract object key
-    s3_client.download_file(bucket_name, key, output_path)
+    bucket_name, key = s3_transfer.parse_url(s3_url)
+    s3_transfer.download_file(bucket_name, key, output_path)
 
 # Function to upload a file to S3 and return its URL
 def upload_file_to_s3(file_path, bucket_name, folder="processed_videos"):
     unique_filename = f"{folder}/{uuid.uuid4()}.mp4"
-    s3_client.upload_file(file_path, bucket_name, unique_filename)
-    file_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{unique_filename}"
+    file_url = s3_transfer.upload_file(file_path, bucket_name, unique_filename)
     print(f"Uploaded file to S3: {file_url}")
     return file_url
 
@@ -71,44 +72,36 @@ def speech_to_text(mp3_path):
     print("The transcription text is", transcription.text)
     return transcription
 
+# Parse the model's {'word': 'time'} answer. Anything else raises, so it is never cached.
+def parse_se_object(text):
+    se_dict = json.loads(text.replace("'", '"'))
+    if not isinstance(se_dict, dict):
+        raise ValueError(f"Expected word -> timestamp pairs, got: {text}")
+    return se_dict
+
 def create_se_object(transcription_text):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+        client,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "The words you give will be used in a text to sound effects model"},
             {"role": "user", "content": f"Your job is to extract the word and the respective time stamp from {transcription_text} which have a very distinct sound associated with the word.  Limit the list to a maximum of 5-7 highly relevant words. Please give your response in this format" + " - {'word1': 'time1', 'word2': 'time2'} and so on. Please don't include any other text in the response. "}
-        ]
+        ],
+        parse=parse_se_object
     )
-    response = completion.choices[0].message.content
     print("The Sound effects object is ", response)
     return response
 
-def generate_sound_effect(word):
+def generate_sound_effect(word, folder_path):
     unique_filename = f"{uuid.uuid4()}.mp3"
-    folder_path = "text-to-se"
-    os.makedirs(folder_path, exist_ok=True)
-    output_path = os.path.join(folder_path, unique_filename)
-    
-    print(f"Generating sound effect for '{word}'...")
-    result = elevenlabs.text_to_sound_effects.convert(
-        text=word,
-        duration_seconds=1,
-        prompt_influence=0.3,
-    )
-
-    with open(output_path, "wb") as f:
-        for chunk in result:
-            f.write(chunk)
-    print(f"Audio saved to {output_path}")
-
+    sound_effect(word, os.path.join(folder_path, unique_filename), duration_seconds=1, prompt_influence=0.3)
     return word, unique_filename
 
-def insert_sound_effects_from_s3(s3_url, se_object, word_to_audio_mapping, sound_effects_folder, output_path, temp_video_path="temp_video_se.mp4"):
+def insert_sound_effects_from_s3(s3_url, se_object, word_to_audio_mapping, sound_effects_folder, output_path, temp_video_path):
     try:
         # Download the video from S3
-        bucket_name = s3_url.split('/')[2].split('.')[0]
-        key = '/'.join(s3_url.split('/')[3:])
-        s3_client.download_file(bucket_name, key, temp_video_path)
+        bucket_name, key = s3_transfer.parse_url(s3_url)
+        s3_transfer.download_file(bucket_name, key, temp_video_path)
         print(f"Video downloaded from S3 and saved to {temp_video_path}")
 
         # Load the video
@@ -140,67 +133,58 @@ def insert_sound_effects_from_s3(s3_url, se_object, word_to_audio_mapping, sound
     except Exception as e:
         print(f"Error inserting sound effects: {e}")
 
-def clear_assets(folders):
+# Full sound-effects pipeline, returns (payload, http_status)
+def run_process_video(s3_url):
     try:
-        for folder in folders:
-            if os.path.exists(folder):
-                for file in os.listdir(folder):
-                    file_path = os.path.join(folder, file)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                    print(f"Deleted file: {file_path}")
-            else:
-                os.makedirs(folder)
+        # Scratch files live in a per-request workspace that is removed afterwards
+        with Workspace("process-video") as workspace:
+            # Prepare folders and paths
+            sound_effects_folder = workspace.folder("text-to-se")
+            output_folder = workspace.folder("extract_video_se")
+            output_path = workspace.path("final_video_with_sound_effects.mp4")
+            video_path = workspace.path("temp_video.mp4")
+
+            # Download video from S3
+            print("Downloading video...")
+            download_video_from_s3(s3_url, video_path)
+
+            # Extract audio and process
+            print("Extracting audio...")
+            extract_audio(video_path, output_folder)
+            transcription = speech_to_text(os.path.join(output_folder, "temp_video.mp3"))
+            print("Transcription Created")
+            se_dict = create_se_object(transcription.text)
+
+            # Generate sound effects and map words to filenames
+            word_to_audio_mapping = {}
+            for word in se_dict.keys():
+                word, filename = generate_sound_effect(word, sound_effects_folder)
+                word_to_audio_mapping[word] = filename
+
+            # Insert sound effects into the video
+            insert_sound_effects_from_s3(s3_url, se_dict, word_to_audio_mapping, sound_effects_folder, output_path,
+                                         workspace.path("temp_video_se.mp4"))
+
+            # Upload final video to S3 and return its URL
+            final_video_url = upload_file_to_s3(output_path, s3_bucket_name)
+            print(f"Final video URL: {final_video_url}")
+
+            return {"final_video_url": final_video_url}, 200
+
     except Exception as e:
-        print(f"Error clearing assets: {e}")
+        print(f"Error: {e}")
+        return {"error": str(e)}, 500
 
 @app.route('/process-video', methods=['POST'])
 def process_video():
-    try:
-        # Parse the request
-        data = request.get_json()
-        s3_url = data.get("s3_url")
-        if not s3_url:
-            return jsonify({"error": "Missing 's3_url' in request."}), 400
-
-        # Prepare folders and paths
-        asset_folders = ["text-to-se", "extract_video_se"]
-        clear_assets(asset_folders)
-        sound_effects_folder = "text-to-se"
-        output_path = "final_video_with_sound_effects.mp4"
-        video_path = "temp_video.mp4"
-        output_folder = "extract_video_se"
-
-        # Download video from S3
-        print("Downloading video...")
-        download_video_from_s3(s3_url, video_path)
-
-        # Extract audio and process
-        print("Extracting audio...")
-        extract_audio(video_path, output_folder)
-        transcription = speech_to_text(os.path.join(output_folder, "temp_video.mp3"))
-        print("Transcription Created")
-        se_object = create_se_object(transcription.text)
-        se_dict = json.loads(se_object.replace("'", '"'))
-
-        # Generate sound effects and map words to filenames
-        word_to_audio_mapping = {}
-        for word in se_dict.keys():
-            word, filename = generate_sound_effect(word)
-            word_to_audio_mapping[word] = filename
-
-        # Insert sound effects into the video
-        insert_sound_effects_from_s3(s3_url, se_dict, word_to_audio_mapping, sound_effects_folder, output_path)
-
-        # Upload final video to S3 and return its URL
-        final_video_url = upload_file_to_s3(output_path, s3_bucket_name)
-        print(f"Final video URL: {final_video_url}")
-
-        return jsonify({"final_video_url": final_video_url}), 200
-
-    except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+    # Parse the request
+    data = request.get_json()
+    s3_url = data.get("s3_url")
+    if not s3_url:
+        return jsonify({"error": "Missing 's3_url' in request."}), 400
+
+    # Pass "async": true to get a job id back instead of waiting for the video
+    return run_or_submit(jobs, data, run_process_video, s3_url)
 
 if __name__ == "__main__":
     app.run(debug= True, host="0.0.0.0", port=7050)
@@ -4,15 +4,17 @@ import openai
 import os
 import uuid
 from elevenlabs import ElevenLabs
-import requests, base64
+import base64
+import http_pool
 import json
 import re
 from pydub import AudioSegment
 from moviepy.editor import *
 import shutil  # For deleting folder contents
-import boto3
+import s3_transfer
 from botocore.exceptions import NoCredentialsError
 from moviepy.editor import ImageClip, concatenate_videoclips, AudioFileClip
+from llm_cache import chat_completion
 
 # API keys from environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -26,12 +28,8 @@ client = openai.OpenAI(api_key=openai_api_key)
 
 # Function to upload video to S3
 def upload_file_to_s3(file_path, bucket_name, s3_filename):
-    s3 = boto3.client('s3', region_name=aws_region,
-                      aws_access_key_id=aws_access_key,
-                      aws_secret_access_key=aws_secret_key)
     try:
-        s3.upload_file(file_path, bucket_name, s3_filename)
-        s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_filename}"
+        s3_url = s3_transfer.upload_file(file_path, bucket_name, s3_filename)
         print(f"File uploaded to {s3_url}")
         return s3_url
     except FileNotFoundError:
@@ -44,14 +42,14 @@ def upload_file_to_s3(file_path, bucket_name, s3_filename):
 # Function to generate text prompts
 def generate_text(topic, num_prompts):
     try:
-        completion = client.chat.completions.create(
+        response = chat_completion(
+            client,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Generate short, vivid sentences describing scenes for a story."},
                 {"role": "user", "content": f"Generate {num_prompts} short sentences about {topic}. Numbered list only."}
             ]
         )
-        response = completion.choices[0].message.content
         sentences = re.split(r'\d+\.\s', response)[1:]  # Split by numbered list, ignore the first empty element
         cleaned_sentences = [sentence.strip().replace("\n", "") for sentence in sentences]
         print("Generated image prompts:", cleaned_sentences)  # Debugging output
@@ -100,7 +98,7 @@ def create_consistent_images(num_prompts, topic, subject_description, consistent
         }
 
         print("Sending payload:", payload)  # Debugging payload output
-        response = requests.post(invoke_url, headers=headers, json=payload)
+        response = http_pool.post(invoke_url, headers=headers, json=payload)
         
         if response.status_code != 200:
             print(f"Error {response.status_code}: {response.json()}")
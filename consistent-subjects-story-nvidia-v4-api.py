@@ -4,15 +4,17 @@ import openai
 import os
 import uuid
 from elevenlabs import ElevenLabs
-import requests, base64
+import base64
+import http_pool
 import json
 import re
 from pydub import AudioSegment
 from moviepy.editor import *
-import shutil  # For deleting folder contents
-import boto3
+import s3_transfer
 from botocore.exceptions import NoCredentialsError
 from moviepy.editor import ImageClip, concatenate_videoclips, AudioFileClip
+from llm_cache import chat_completion, register_cache_bypass
+from workspace import Workspace
 
 # API keys from environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -25,15 +27,13 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 client = openai.OpenAI(api_key=openai_api_key)
 
 app = Flask(__name__)
+register_cache_bypass(app)
+http_pool.register_http_stats_route(app)
 
 # Function to upload video to S3
 def upload_file_to_s3(file_path, bucket_name, s3_filename):
-    s3 = boto3.client('s3', region_name=aws_region,
-                      aws_access_key_id=aws_access_key,
-                      aws_secret_access_key=aws_secret_key)
     try:
-        s3.upload_file(file_path, bucket_name, s3_filename)
-        s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_filename}"
+        s3_url = s3_transfer.upload_file(file_path, bucket_name, s3_filename)
         print(f"File uploaded to {s3_url}")
         return s3_url
     except FileNotFoundError:
@@ -46,14 +46,14 @@ def upload_file_to_s3(file_path, bucket_name, s3_filename):
 # Function to generate text prompts
 def generate_text(topic, num_prompts):
     try:
-        completion = client.chat.completions.create(
+        response = chat_completion(
+            client,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Generate short, vivid sentences describing scenes for a story."},
                 {"role": "user", "content": f"Generate {num_prompts} short sentences about {topic}. Numbered list only."}
             ]
         )
-        response = completion.choices[0].message.content
         sentences = re.split(r'\d+\.\s', response)[1:]  # Split by numbered list, ignore the first empty element
         cleaned_sentences = [sentence.strip().replace("\n", "") for sentence in sentences]
         print("Generated image prompts:", cleaned_sentences)  # Debugging output
@@ -62,15 +62,8 @@ def generate_text(topic, num_prompts):
         print("Error generating text:", e)
         return []
 
-# Function to clean up folders before processing
-def clean_folder(folder_path):
-    if os.path.exists(folder_path):
-        shutil.rmtree(folder_path)
-    os.makedirs(folder_path)
-    print(f"Cleaned and created folder: {folder_path}")  # Debugging output
-
-# Function to create consistent images
-def create_consistent_images(num_prompts, topic, subject_description, consistent_subjects, image_prompts):
+# Function to create consistent images in image_folder, return their paths in order
+def create_consistent_images(num_prompts, topic, subject_description, consistent_subjects, image_prompts, image_folder):
     nvidia_api_key = os.getenv("NVIDIA_API_KEY")
     invoke_url = "https://ai.api.nvidia.com/v1/genai/nvidia/consistory"
     headers = {
@@ -78,8 +71,7 @@ def create_consistent_images(num_prompts, topic, subject_description, consistent
         "Accept": "application/json",
     }
     
-    image_folder = "/Users/amir/Desktop/all_apis/lib/python3.12/site-packages/consistent_images"
-    clean_folder(image_folder)
+    image_paths = []
 
     max_prompts = min(num_prompts, len(image_prompts))  # Ensure we do not exceed available prompts
     print(f"Using max prompts: {max_prompts} out of {len(image_prompts)} available prompts")  # Debugging output
@@ -102,7 +94,7 @@ def create_consistent_images(num_prompts, topic, subject_description, consistent
         }
 
         print("Sending payload:", payload)  # Debugging payload output
-        response = requests.post(invoke_url, headers=headers, json=payload)
+        response = http_pool.post(invoke_url, headers=headers, json=payload)
         
         if response.status_code != 200:
             print(f"Error {response.status_code}: {response.json()}")
@@ -119,21 +111,19 @@ def create_consistent_images(num_prompts, topic, subject_description, consistent
                 img_path = f"{image_folder}/image_{i}_{idx}.jpg"
                 with open(img_path, "wb") as f:
                     f.write(base64.b64decode(img_base64))
+                image_paths.append(img_path)
                 print(f"Saved image at {img_path}")
             else:
                 print(f"No base64 data for image {idx} in response for prompt {i}")
 
-    return image_folder
+    return image_paths
 
 # Function to create final video with audio
-def create_final_video_with_audio(image_folder, output_folder, audio_file, final_video_name="final_video_with_audio.mp4", duration=2):
-    clean_folder(output_folder)
-    
-    images = sorted([os.path.join(image_folder, img) for img in os.listdir(image_folder) if img.endswith(('.jpg', '.jpeg', '.png'))])
-    print("Found image files:", images)
+def create_final_video_with_audio(images, final_video_path, audio_file, duration=2):
+    print("Using image files:", images)
 
     if not images:
-        print("No images found in the specified folder.")
+        print("No images were created.")
         return None
     
     try:
@@ -147,7 +137,6 @@ def create_final_video_with_audio(image_folder, output_folder, audio_file, final
         audio = audio.subclip(0, final_clip.duration)
 
         final_clip = final_clip.set_audio(audio)
-        final_video_path = os.path.join(output_folder, final_video_name)
         final_clip.write_videofile(final_video_path, codec="libx264", audio_codec="aac", fps=24)
         print(f"Final video with audio saved at: {final_video_path}")
         return final_video_path
@@ -171,23 +160,26 @@ def generate_video():
         return jsonify({"error": "No prompts generated."}), 400
 
     # Define paths and execute the video creation
-    image_folder = "/Users/amir/Desktop/all_apis/lib/python3.12/site-packages/consistent_images"
-    output_folder = "/Users/amir/Desktop/all_apis/lib/python3.12/site-packages/combined_consistent_videos"
     audio_file = "/Users/amir/Desktop/all_apis/lib/python3.12/site-packages/emotional_music.mp3"
 
-    print("Creating images...")
-    create_consistent_images(num_prompts, topic, subject_description, consistent_subjects, image_prompts)
+    # Scratch files live in a per-request workspace that is removed afterwards
+    with Workspace("consistent-subjects") as workspace:
+        print("Creating images...")
+        image_paths = create_consistent_images(num_prompts, topic, subject_description, consistent_subjects,
+                                               image_prompts, workspace.folder("consistent_images"))
 
-    print("Creating final video with audio...")
-    final_video_path = create_final_video_with_audio(image_folder, output_folder, audio_file)
-    if not final_video_path:
-        return jsonify({"error": "Failed to create final video."}), 500
-
-    # Upload to S3
-    s3_filename = f"{uuid.uuid4()}.mp4"
-    s3_url = upload_file_to_s3(final_video_path, s3_bucket_name, s3_filename)
-    if not s3_url:
-        return jsonify({"error": "Failed to upload video to S3."}), 500
+        print("Creating final video with audio...")
+        final_video_path = create_final_video_with_audio(
+            image_paths, workspace.path("combined_consistent_videos", "final_video_with_audio.mp4"), audio_file
+        )
+        if not final_video_path:
+            return jsonify({"error": "Failed to create final video."}), 500
+
+        # Upload to S3
+        s3_filename = f"{uuid.uuid4()}.mp4"
+        s3_url = upload_file_to_s3(final_video_path, s3_bucket_name, s3_filename)
+        if not s3_url:
+            return jsonify({"error": "Failed to upload video to S3."}), 500
 
     return jsonify({"s3_url": s3_url}), 200
 
@@ -6,27 +6,25 @@ User inputs a prompt and specifies - Topic, Author, Mood, Length of responses, L
 
 
 import os
-import boto3
+import s3_transfer
 from PIL import Image
-import requests
 from io import BytesIO
 import asyncio
 import fal_client
 import openai
-from elevenlabs import ElevenLabs
-import json
 import uuid
-from pydub import AudioSegment
-import requests
+import http_pool
 from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips
 import os
+from llm_cache import chat_completion
+from tts_client import synthesize
 
 
 '''Function defined ahead:
 1. Upload to S3 - upload_file_to_s3
 2. Text to Video using Kling - text_to_video
 3. Create Fact using GPT4o-mini - create_fact
-4. Generate Audio from text generated with GPT - submit_text, get_history_item_id, create_audiofile
+4. Generate Audio from text generated with GPT - create_audiofile
 5. Download Video helper function- download_video
 6. Combine generated_audio and generated_video folders - combine_audio_video
 
@@ -50,13 +48,8 @@ client = openai.OpenAI(api_key=openai_api_key)
 
 #Upload to S3 function
 def upload_file_to_s3(file_path, bucket_name, s3_filename):
-    s3 = boto3.client('s3',
-                      region_name=aws_region,
-                      aws_access_key_id=aws_access_key,
-                      aws_secret_access_key=aws_secret_key)
     try:
-        s3.upload_file(file_path, bucket_name, s3_filename)
-        s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_filename}"
+        s3_url = s3_transfer.upload_file(file_path, bucket_name, s3_filename)
         print(f"File uploaded to {s3_url}")
         return s3_url
     except FileNotFoundError:
@@ -112,67 +105,24 @@ async def text_to_video(prompt):
 def create_fact(topic, author, mood):
 
     
-        completion = client.chat.completions.create(
+        response = chat_completion(
+            client,
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are a super intriguing fact writer"},
                 {"role": "user", "content": f"Your job is to generate only 1 fact about  {topic} by author {author} in {mood}"}
             ]
         )
-        response = completion.choices[0].message.content
         print("The generated fact is ", response)
 
         
         return response
 
-# Function to submit text to ElevenLabs
-def submit_text(generated_text):
-    url = "https://api.elevenlabs.io/v1/text-to-speech/TlLWC5O5AUzxAg7ysFZB"
-    headers = {
-        "Content-Type": "application/json",
-        "xi-api-key": elevenlabs_api_key
-    }
-    data = {
-        "text": generated_text,
-        "voice_settings": {
-            "stability": 0.1,
-            "similarity_boost": 0
-        }
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    if response.status_code == 200:
-        print("Success:", response.content)
-    else:
-        print(f"Error {response.status_code}: {response.content}")
-
-# Function to get history item ID from ElevenLabs
-def get_history_item_id():
-    client = ElevenLabs(api_key=elevenlabs_api_key)
-    resp = client.history.get_all(page_size=1, voice_id="TlLWC5O5AUzxAg7ysFZB")
-    history_item_id = resp.history[0].history_item_id
-    return history_item_id
-    
-# Function to create audio file
-def create_audiofile(history_item_id, durations):
-    output_folder = "generated_audio"
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    client = ElevenLabs(api_key=elevenlabs_api_key)
-    audio_generator = client.history.get_audio(history_item_id=str(history_item_id))
-
-    unique_id = str(uuid.uuid4())
-    filename = f"{unique_id}.mp3"
-    file_path = os.path.join(output_folder, filename)
-
-    with open(file_path, "wb") as audio_file:
-        for chunk in audio_generator:
-            audio_file.write(chunk)
-
-    audio = AudioSegment.from_file(file_path)
-    duration = len(audio) / 1000
+# Function to create audio file, reused from the local TTS cache when this exact text was voiced before
+def create_audiofile(generated_text, durations):
+    file_path = os.path.join("generated_audio", f"{uuid.uuid4()}.mp3")
+    file_path, duration = synthesize(generated_text, file_path)
     durations.append(duration)
-    print(f"{file_path} saved successfully, duration: {duration} seconds")
     return file_path
 
 
@@ -186,7 +136,7 @@ def download_video(video_url):
     file_path = os.path.join(folder_path, file_name)
     
     # Download the video
-    response = requests.get(video_url, stream=True)
+    response = http_pool.get(video_url, stream=True)
     if response.status_code == 200:
         with open(file_path, "wb") as file:
             for chunk in response.iter_content(chunk_size=8192):
@@ -269,11 +219,7 @@ for j in range (num_facts):
     generated_text = create_fact(topic, author, mood) #Generating text
     print("Done with generating text")
     prompt = "Create a artistic video about "+ generated_text
-    submit_text(generated_text) #Submitting text to Elevenlabs
-    print("Text submitted to Elevenlabs")
-    history_item_id = get_history_item_id() #Get the history of the submiited voice job
-    print("The Elevenlabs histroy item id is ", history_item_id)
-    audio_file_path = create_audiofile(history_item_id, durations) #creating audio file in local
+    audio_file_path = create_audiofile(generated_text, durations) #creating audio file in local
     print("Audiofile created successfully at location", audio_file_path)
     video_url, video_response = asyncio.run(text_to_video(prompt))
     print("Video created successfully by Kling")
@@ -2,15 +2,16 @@ from flask import Flask, request, jsonify, send_file
 import openai
 import os
 import uuid
-from elevenlabs import ElevenLabs
-import requests
-import json
 import re
-from pydub import AudioSegment
 from moviepy.editor import *
-import shutil  # For deleting folder contents
-import boto3
+import s3_transfer
 from botocore.exceptions import NoCredentialsError
+import http_pool
+from llm_cache import chat_completion, register_cache_bypass
+from tts_client import synthesize
+from image_store import generate_dalle_image
+from workspace import Workspace
+from job_queue import JobQueue, register_job_routes, run_or_submit
 
 # AWS credentials and S3 bucket details from environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -19,10 +20,13 @@ s3_bucket_name = os.getenv("S3_BUCKET_NAME")
 aws_region = os.getenv("AWS_REGION")  # e.g., 'us-east-1'
 
 app = Flask(__name__)
+jobs = JobQueue()
+register_job_routes(app, jobs)
+register_cache_bypass(app)
+http_pool.register_http_stats_route(app)
 
 # API keys from environment variables
 openai_api_key = os.getenv("OPENAI_API_KEY")
-elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
 
 # Initialize the OpenAI client
 client = openai.OpenAI(api_key=openai_api_key)
@@ -30,14 +34,8 @@ client = openai.OpenAI(api_key=openai_api_key)
 
 # Function to upload video to S3
 def upload_file_to_s3(file_path, bucket_name, s3_filename):
-    s3 = boto3.client('s3', 
-                      region_name=aws_region, 
-                      aws_access_key_id=aws_access_key, 
-                      aws_secret_access_key=aws_secret_key)
-
     try:
-        s3.upload_file(file_path, bucket_name, s3_filename)
-        s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_filename}"
+        s3_url = s3_transfer.upload_file(file_path, bucket_name, s3_filename)
         print(f"File uploaded to {s3_url}")
         return s3_url
     except FileNotFoundError:
@@ -50,130 +48,67 @@ def upload_file_to_s3(file_path, bucket_name, s3_filename):
 
 # Function to generate text
 def generate_text(topic, num_frames):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+        client,
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are facts generator"},
             {"role": "user", "content": f"Your job is to generate {num_frames} single line sentences which will be used in a voiceover about the topic {topic}. Please give numbered list only like 1. 2. 3. and so on"}
         ]
     )
-    response = completion.choices[0].message.content
     sentences = re.split(r'\d+\.\s', response)[1:]  # Split by numbered list, and ignore the first empty element
     cleaned_sentences = [sentence.strip().replace("\n", "") for sentence in sentences]
     
     return cleaned_sentences
 
-# Function to generate image
-def generate_image(text):
-    resp = client.images.generate(
-        model="dall-e-3",
-        prompt=str(text),
-        n=1,
-        size="1024x1024"
-    )
-    image_url = resp.data[0].url
-    unique_filename = f"{uuid.uuid4()}.png"
-    folder = "generated_images"
-    if not os.path.exists(folder):
-        os.makedirs(folder)
-    
-    image_data = requests.get(image_url).content
-    with open(os.path.join(folder, unique_filename), 'wb') as image_file:
-        image_file.write(image_data)
-    
-    print(f"Image saved as {unique_filename} in the {folder} folder")
-
-# Function to submit text to ElevenLabs
-def submit_text(generated_text):
-    url = "https://api.elevenlabs.io/v1/text-to-speech/TlLWC5O5AUzxAg7ysFZB"
-    headers = {
-        "Content-Type": "application/json",
-        "xi-api-key": elevenlabs_api_key
-    }
-    data = {
-        "text": generated_text,
-        "voice_settings": {
-            "stability": 0.1,
-            "similarity_boost": 0
-        }
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    if response.status_code == 200:
-        print("Success:", response.content)
-    else:
-        print(f"Error {response.status_code}: {response.content}")
-
-# Function to get history item ID from ElevenLabs
-def get_history_item_id():
-    client = ElevenLabs(api_key=elevenlabs_api_key)
-    resp = client.history.get_all(page_size=1, voice_id="TlLWC5O5AUzxAg7ysFZB")
-    history_item_id = resp.history[0].history_item_id
-    return history_item_id
-
-# Function to create audio file
-def create_audiofile(history_item_id, durations):
-    output_folder = "generated_audio"
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    client = ElevenLabs(api_key=elevenlabs_api_key)
-    audio_generator = client.history.get_audio(history_item_id=str(history_item_id))
-
-    unique_id = str(uuid.uuid4())
-    filename = f"{unique_id}.mp3"
-    file_path = os.path.join(output_folder, filename)
-
-    with open(file_path, "wb") as audio_file:
-        for chunk in audio_generator:
-            audio_file.write(chunk)
-
-    audio = AudioSegment.from_file(file_path)
-    duration = len(audio) / 1000
-    durations.append(duration)
-    print(f"{file_path} saved successfully, duration: {duration} seconds")
-
-# Function to create video from images and audio
-def create_video(durations):
-    audio_folder = "generated_audio"
-    image_folder = "generated_images"
-    output_folder = "generated_video"
-
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+# Function to generate image, return its path
+def generate_image(text, workspace):
+    image_path = generate_dalle_image(client, str(text), workspace.new_file("generated_images", ".png"))
+    print(f"Image saved as {image_path}")
+    return image_path
 
-    audio_files = sorted([f for f in os.listdir(audio_folder) if f.endswith('.mp3')])
-    image_files = sorted([f for f in os.listdir(image_folder) if f.endswith('.png')])
+# Function to create audio file, reused from the local TTS cache when this exact text was voiced before
+def create_audiofile(text, workspace):
+    return synthesize(text, workspace.new_file("generated_audio", ".mp3"))
 
+# Function to create video from (audio_path, image_path, duration) frames in order
+def create_video(frames, output_path):
     clips = []
 
-    for audio_file, image_file, duration in zip(audio_files, image_files, durations):
-        audio_clip = AudioFileClip(os.path.join(audio_folder, audio_file))
-        image_clip = ImageClip(os.path.join(image_folder, image_file)).set_duration(duration)
+    for audio_path, image_path, duration in frames:
+        audio_clip = AudioFileClip(audio_path)
+        image_clip = ImageClip(image_path).set_duration(duration)
         video_clip = image_clip.set_audio(audio_clip)
         clips.append(video_clip)
 
     final_clip = concatenate_videoclips(clips)
-    output_path = os.path.join(output_folder, "final_video.mp4")
     final_clip.write_videofile(output_path, fps=24, codec='libx264', audio_codec='aac')
 
     print(f"Video saved as {output_path}")
-    cleanup_folders([audio_folder, image_folder])
     return output_path
 
-# Function to clean up folders after processing
-def cleanup_folders(folders):
-    for folder in folders:
-        if os.path.exists(folder):
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
-                try:
-                    if os.path.isfile(file_path):
-                        os.unlink(file_path)
-                    elif os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-                except Exception as e:
-                    print(f"Failed to delete {file_path}. Reason: {e}")
-            print(f"Cleaned up {folder} folder")
+# Full image-story pipeline, returns (payload, http_status)
+def run_image_story(topic, num_frames):
+    # Scratch files live in a per-request workspace that is removed afterwards
+    with Workspace("facts-image-story") as workspace:
+        generated_array = generate_text(topic, num_frames)
+
+        frames = []
+        for text in generated_array:
+            audio_path, duration = create_audiofile(text, workspace)
+            image_path = generate_image(text, workspace)
+            frames.append((audio_path, image_path, duration))
+
+        video_path = create_video(frames, workspace.path("generated_video", "final_video.mp4"))
+
+        # Upload the video to S3
+        unique_s3_filename = f"videos/{uuid.uuid4()}.mp4"
+        s3_url = upload_file_to_s3(video_path, s3_bucket_name, unique_s3_filename)
+
+    if s3_url:
+        return {"s3_url": s3_url}, 200
+    else:
+        return {"error": "Failed to upload video to S3"}, 500
 
 # Modify the Flask endpoint for image-story
 @app.route('/image-story', methods=['POST'])
@@ -190,25 +125,8 @@ def image_story():
     except ValueError:
         return jsonify({"error": "'num_frames' must be an integer"}), 400
 
-    durations = []
-    generated_array = generate_text(topic, num_frames)
-    
-    for text in generated_array:
-        submit_text(text)
-        history_id = get_history_item_id()
-        create_audiofile(history_id, durations)
-        generate_image(text)
-    
-    video_path = create_video(durations)
-
-    # Upload the video to S3
-    unique_s3_filename = f"videos/{uuid.uuid4()}.mp4"
-    s3_url = upload_file_to_s3(video_path, s3_bucket_name, unique_s3_filename)
-
-    if s3_url:
-        return jsonify({"s3_url": s3_url}), 200
-    else:
-        return jsonify({"error": "Failed to upload video to S3"}), 500
+    # Pass "async": true to get a job id back instead of waiting for the video
+    return run_or_submit(jobs, data, run_image_story, topic, num_frames)
 
 # Flask app runs as usual
 if __name__ == '__main__':
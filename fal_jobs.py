@@ -0,0 +1,263 @@
+'''
+Completion tracking for fal queue jobs (Kling text-to-video / image-to-video).
+
+All jobs of a process go through one FalJobManager, which owns a background
+event loop, a global concurrency cap and a single polling scheduler. Jobs are
+submitted with a webhook_url when FAL_WEBHOOK_URL and FAL_WEBHOOK_SECRET are
+set. fal then POSTs the result to /fal/webhook, which checks the secret and
+resolves the waiting future at once. Status polling stays as a fallback for
+lost webhooks: it backs off while a webhook is expected, and stays at a few
+seconds for jobs that have no webhook.
+
+To test against a local fal stand-in, either point FAL_QUEUE_RUN_HOST at it
+or build a FalJobManager with any object that has
+submit_async/status_async/result_async as `backend`.
+'''
+
+import asyncio
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlencode
+
+import fal_client
+from flask import Flask, jsonify, request
+
+# Public URL of this process' webhook route, e.g. http://<EXTERNAL_IP>:7015/fal/webhook
+FAL_WEBHOOK_URL = os.getenv("FAL_WEBHOOK_URL")
+# Shared secret fal sends back in the webhook URL. Without it no webhooks are
+# requested and the route rejects every call.
+FAL_WEBHOOK_SECRET = os.getenv("FAL_WEBHOOK_SECRET")
+# Port for the standalone webhook receiver used by scripts without a Flask app
+FAL_WEBHOOK_PORT = os.getenv("FAL_WEBHOOK_PORT")
+
+# Polling: first check after this many seconds, then growing up to the max.
+# Jobs without a webhook depend on polling alone, so they stay close to the
+# initial interval; jobs with one only poll to catch lost webhooks.
+FAL_POLL_INITIAL_DELAY = float(os.getenv("FAL_POLL_INITIAL_DELAY", "2"))
+FAL_POLL_NO_WEBHOOK_MAX_DELAY = float(os.getenv("FAL_POLL_NO_WEBHOOK_MAX_DELAY", "3"))
+FAL_POLL_WEBHOOK_DELAY = float(os.getenv("FAL_POLL_WEBHOOK_DELAY", "15"))
+FAL_POLL_MAX_DELAY = float(os.getenv("FAL_POLL_MAX_DELAY", "30"))
+FAL_JOB_TIMEOUT = float(os.getenv("FAL_JOB_TIMEOUT", "1800"))
+# Global cap on jobs in flight at fal from this process
+FAL_MAX_CONCURRENT_JOBS = int(os.getenv("FAL_MAX_CONCURRENT_JOBS", "8"))
+# How often the scheduler looks for jobs that are due for a status check
+FAL_SCHEDULER_TICK = 0.5
+# Webhooks for request ids nobody is waiting on are dropped after this long
+UNCLAIMED_WEBHOOK_TTL = 3600
+
+
+# Maps fal request ids to futures that the webhook route resolves
+class FalWebhookRegistry:
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def _entry(self, request_id):
+        if request_id not in self.pending:
+            self.pending[request_id] = (Future(), time.time())
+        return self.pending[request_id][0]
+
+    # Return the future for a request id. A webhook may already have arrived
+    # before submit returned, in which case the future is already resolved.
+    def register(self, request_id):
+        with self.lock:
+            cutoff = time.time() - UNCLAIMED_WEBHOOK_TTL
+            for stale_id in [rid for rid, (fut, created) in self.pending.items() if created < cutoff]:
+                del self.pending[stale_id]
+            return self._entry(request_id)
+
+    def resolve(self, request_id, payload=None, error=None):
+        with self.lock:
+            future = self._entry(request_id)
+        if future.done():
+            return
+        if error:
+            future.set_exception(Exception(f"fal request {request_id} failed: {error}"))
+        else:
+            future.set_result(payload)
+
+    def discard(self, request_id):
+        with self.lock:
+            self.pending.pop(request_id, None)
+
+
+registry = FalWebhookRegistry()
+
+
+# url with the shared secret added, so the webhook route can tell fal's calls from anyone else's
+def signed_webhook_url(url):
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}{urlencode({'secret': FAL_WEBHOOK_SECRET})}"
+
+
+# Add the POST /fal/webhook receiver to a Flask app
+def register_webhook_route(app, path="/fal/webhook"):
+    @app.route(path, methods=['POST'])
+    def fal_webhook():
+        secret = request.args.get("secret", "")
+        if not FAL_WEBHOOK_SECRET or not hmac.compare_digest(secret.encode(), FAL_WEBHOOK_SECRET.encode()):
+            return jsonify({"error": "Invalid webhook secret"}), 403
+
+        data = request.get_json(silent=True) or {}
+        request_id = data.get("request_id")
+        if not request_id:
+            return jsonify({"error": "Missing 'request_id'"}), 400
+
+        if data.get("status") == "OK":
+            registry.resolve(request_id, payload=data.get("payload"))
+        else:
+            registry.resolve(request_id, error=data.get("error") or data.get("payload") or "unknown error")
+        print(f"fal webhook received for {request_id}: {data.get('status')}")
+        return jsonify({"received": True}), 200
+
+
+# Scripts that have no Flask app of their own can run a bare receiver thread
+def start_webhook_server(port=None):
+    from werkzeug.serving import make_server
+
+    app = Flask("fal_webhooks")
+    register_webhook_route(app)
+    server = make_server("0.0.0.0", int(port or FAL_WEBHOOK_PORT), app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True, name="fal-webhooks").start()
+    return server
+
+
+# One long-lived event loop per process that owns every outstanding fal job.
+# A single scheduler polls whichever jobs are due, with per-job intervals, and a
+# semaphore caps how many jobs are in flight at fal at once.
+class FalJobManager:
+    def __init__(self, backend=fal_client, max_concurrent=None, webhook_url=None):
+        self.backend = backend
+        self.max_concurrent = max_concurrent or FAL_MAX_CONCURRENT_JOBS
+        self.webhook_url = webhook_url or FAL_WEBHOOK_URL
+        self.jobs = {}  # request_id -> job state, only touched on the loop thread
+        self.loop = asyncio.new_event_loop()
+        self.slots = None
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, args=(started,), daemon=True, name="fal-job-manager")
+        self.thread.start()
+        started.wait()
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        self.loop.create_task(self._scheduler())
+        self.loop.call_soon(started.set)
+        self.loop.run_forever()
+
+    # Start a job from any thread. Returns a concurrent.futures.Future of the
+    # result payload; use .result() to block or asyncio.wrap_future to await it.
+    def submit(self, application, arguments, webhook_url=None):
+        handle = Future()
+        asyncio.run_coroutine_threadsafe(self._start(application, arguments, webhook_url, handle), self.loop)
+        return handle
+
+    async def _start(self, application, arguments, webhook_url, handle):
+        webhook_url = webhook_url or self.webhook_url
+        if webhook_url and not FAL_WEBHOOK_SECRET:
+            print("FAL_WEBHOOK_SECRET is not set, polling instead of using the webhook")
+            webhook_url = None
+        await self.slots.acquire()
+        try:
+            submitted = await self.backend.submit_async(
+                application, arguments=arguments, webhook_url=signed_webhook_url(webhook_url) if webhook_url else None
+            )
+        except Exception as e:
+            self.slots.release()
+            handle.set_exception(e)
+            return
+
+        request_id = submitted.request_id
+        print("Request ID:", request_id)
+        delay = FAL_POLL_WEBHOOK_DELAY if webhook_url else FAL_POLL_INITIAL_DELAY
+        done = registry.register(request_id)
+        self.jobs[request_id] = {
+            "application": application,
+            "done": done,
+            "handle": handle,
+            "delay": delay,
+            "max_delay": FAL_POLL_MAX_DELAY if webhook_url else FAL_POLL_NO_WEBHOOK_MAX_DELAY,
+            "next_poll": time.monotonic() + delay,
+            "deadline": time.monotonic() + FAL_JOB_TIMEOUT,
+        }
+        # Webhook or poller may resolve `done` from any thread
+        done.add_done_callback(lambda _: self.loop.call_soon_threadsafe(self._finish, request_id))
+
+    def _finish(self, request_id):
+        job = self.jobs.pop(request_id, None)
+        if not job:
+            return
+        registry.discard(request_id)
+        self.slots.release()
+
+        handle = job["handle"]
+        if handle.done():
+            return
+        error = job["done"].exception()
+        if error:
+            handle.set_exception(error)
+        else:
+            handle.set_result(job["done"].result())
+
+    async def _scheduler(self):
+        while True:
+            await asyncio.sleep(FAL_SCHEDULER_TICK)
+            now = time.monotonic()
+            for request_id, job in list(self.jobs.items()):
+                if job["next_poll"] <= now and not job["done"].done():
+                    job["next_poll"] = float("inf")  # not due again until this poll finishes
+                    self.loop.create_task(self._poll(request_id, job))
+
+    async def _poll(self, request_id, job):
+        application = job["application"]
+        try:
+            status = await self.backend.status_async(application, request_id, with_logs=False)
+            print(f"Current Status of {request_id}: {status}")
+            if isinstance(status, fal_client.Completed):
+                if status.error:
+                    registry.resolve(request_id, error=status.error)
+                else:
+                    registry.resolve(request_id, payload=await self.backend.result_async(application, request_id))
+                return
+            # Running jobs are close to done, queued ones can wait longer between checks
+            growth = 1.5 if isinstance(status, fal_client.InProgress) else 2
+        except Exception as e:
+            print(f"Status check for {request_id} failed: {e}")
+            growth = 2
+
+        if time.monotonic() > job["deadline"]:
+            registry.resolve(request_id, error=f"did not finish in {FAL_JOB_TIMEOUT} seconds")
+            return
+        job["delay"] = min(job["delay"] * growth, job["max_delay"])
+        job["next_poll"] = time.monotonic() + job["delay"]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+# The process-wide job manager, created on first use
+def get_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = FalJobManager()
+        return _manager
+
+
+# Start a fal job and return a future of its result payload
+def submit_fal_job(application, arguments, webhook_url=None):
+    return get_manager().submit(application, arguments, webhook_url=webhook_url)
+
+
+# Start a fal job and block until its result payload is available
+def run_fal_job(application, arguments, webhook_url=None):
+    return submit_fal_job(application, arguments, webhook_url=webhook_url).result()
+
+
+# Await a fal job from async code running on any event loop
+async def await_fal_job(application, arguments, webhook_url=None):
+    return await asyncio.wrap_future(submit_fal_job(application, arguments, webhook_url=webhook_url))
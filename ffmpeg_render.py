@@ -0,0 +1,204 @@
+import os
+import stat
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from moviepy.config import get_setting
+
+import media_probe
+
+# Same ffmpeg binary moviepy uses (imageio-ffmpeg's bundled one unless FFMPEG_BINARY is set)
+FFMPEG_BINARY = get_setting("FFMPEG_BINARY")
+# Set FFMPEG_STILL_RENDER=0 to go back to rendering still-image stories through moviepy
+FFMPEG_STILL_RENDER = os.getenv("FFMPEG_STILL_RENDER", "1") == "1"
+
+RENDER_FPS = 24
+# Segments rendered at the same time, one per core by default
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+# Audio parameters are pinned so every segment can be stream-copied into one file
+AUDIO_RATE = 44100
+AUDIO_CHANNELS = 2
+
+
+# Run ffmpeg and raise with its stderr when it fails
+def run_ffmpeg(args):
+    command = [FFMPEG_BINARY, "-y", "-hide_banner", "-loglevel", "error", *args]
+    result = subprocess.run(command, capture_output=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace')}")
+
+
+def _even(value):
+    return int(value) - int(value) % 2
+
+
+# Muxer flags for a finished MP4. Files get the index moved to the front (+faststart).
+# A FIFO, which s3_transfer uploads while it is written, cannot be seeked back into,
+# so it gets fragmented MP4 with an empty moov up front instead; players and ffmpeg
+# read both the same way.
+def mp4_movflags(output_path):
+    if os.path.exists(output_path) and stat.S_ISFIFO(os.stat(output_path).st_mode):
+        return ["-f", "mp4", "-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    return ["-movflags", "+faststart"]
+
+
+# Encode one looped still image, with its narration if given, cut to exactly `duration` seconds
+def render_still_segment(image_path, audio_path, duration, output_path, video_filter, fps=RENDER_FPS):
+    args = ["-loop", "1", "-framerate", str(fps), "-i", image_path]
+    if audio_path:
+        args += ["-i", audio_path, "-map", "0:v", "-map", "1:a",
+                 "-c:a", "aac", "-ar", str(AUDIO_RATE), "-ac", str(AUDIO_CHANNELS)]
+    run_ffmpeg(args + [
+        "-t", f"{duration:.3f}",
+        "-vf", f"{video_filter},format=yuv420p",
+        "-r", str(fps),
+        "-c:v", "libx264", "-preset", "veryfast", "-tune", "stillimage",
+        output_path
+    ])
+    return output_path
+
+
+# Fit a video clip to its narration: cut it, or hold its last frame, to `duration`
+# seconds, centre it on the canvas and put the narration underneath
+def render_broll_segment(video_path, audio_path, duration, canvas_size, output_path, fps=RENDER_FPS):
+    width, height = canvas_size
+    video_filter = (
+        f"tpad=stop_mode=clone:stop_duration={duration:.3f},"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1,format=yuv420p"
+    )
+    run_ffmpeg([
+        "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-t", f"{duration:.3f}",
+        "-vf", video_filter,
+        "-r", str(fps),
+        "-c:v", "libx264", "-preset", "veryfast",
+        "-c:a", "aac", "-ar", str(AUDIO_RATE), "-ac", str(AUDIO_CHANNELS),
+        output_path
+    ])
+    return output_path
+
+
+# Join segments that share codec parameters with the concat demuxer, no re-encode
+def concat_segments(segment_paths, output_path):
+    list_path = os.path.splitext(output_path)[0] + "_segments.txt"
+    with open(list_path, "w") as list_file:
+        for segment_path in segment_paths:
+            escaped = os.path.abspath(segment_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    try:
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", *mp4_movflags(output_path), output_path])
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+# Render independent timeline segments side by side and join them with a stream-copy
+# concat, so the whole video takes about as long as its slowest segment.
+# render(item, segment_path) writes one segment. Renderers that shell out to ffmpeg
+# run in threads, the work happens in the ffmpeg child anyway. Renderers that make
+# frames in Python need use_processes=True to get a core each instead of sharing
+# the GIL; render and items must then be picklable (module-level functions).
+# Segments go to a temporary folder next to output_path that is removed afterwards.
+def render_segments(render, items, output_path, use_processes=False):
+    items = list(items)
+    with tempfile.TemporaryDirectory(prefix="segments-", dir=os.path.dirname(output_path) or ".") as segment_folder:
+        segment_paths = [os.path.join(segment_folder, f"segment_{index:04d}.mp4") for index in range(len(items))]
+
+        workers = max(1, min(RENDER_WORKERS, len(items)))
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=workers) as executor:
+            # Consuming the results re-raises the first failed segment
+            list(executor.map(render, items, segment_paths))
+
+        return concat_segments(segment_paths, output_path)
+
+
+# Put audio_path under the video of video_path. The video stream is copied as is and
+# only the audio is encoded. The result is as long as the video, or as the shorter
+# of the two with trim_to_shortest. Cutting from 0 needs no keyframe at the end.
+def replace_audio(video_path, audio_path, output_path, trim_to_shortest=False):
+    duration = media_probe.duration(video_path)
+    if trim_to_shortest:
+        duration = min(duration, media_probe.duration(audio_path))
+
+    run_ffmpeg([
+        "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-t", f"{duration:.3f}",
+        "-c:v", "copy", "-c:a", "aac",
+        *mp4_movflags(output_path),
+        output_path
+    ])
+    return output_path
+
+
+# Render (image_path, duration) stills plus an optional music track in one ffmpeg encode,
+# with no intermediate clips. Images are centered on a black canvas as large as the
+# largest one, like concatenate_videoclips(method="compose"). Music is cut to the video.
+def render_slideshow(slides, output_path, audio_path=None, fps=RENDER_FPS):
+    slides = list(slides)
+    sizes = [media_probe.dimensions(image_path) for image_path, _ in slides]
+    # Round up to even sizes, libx264 needs them for yuv420p
+    width = _even(max(w for w, _ in sizes) + 1)
+    height = _even(max(h for _, h in sizes) + 1)
+
+    args = []
+    filters = []
+    for index, (image_path, duration) in enumerate(slides):
+        args += ["-loop", "1", "-framerate", str(fps), "-t", f"{duration:.3f}", "-i", image_path]
+        filters.append(f"[{index}:v]pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black,setsar=1,format=yuv420p[v{index}]")
+    inputs = "".join(f"[v{index}]" for index in range(len(slides)))
+    filters.append(f"{inputs}concat=n={len(slides)}:v=1:a=0[video]")
+
+    if audio_path:
+        args += ["-i", audio_path]
+    args += ["-filter_complex", ";".join(filters), "-map", "[video]"]
+    if audio_path:
+        args += ["-map", f"{len(slides)}:a:0", "-c:a", "aac"]
+
+    total_duration = sum(duration for _, duration in slides)
+    args += ["-t", f"{total_duration:.3f}", "-r", str(fps), "-c:v", "libx264", "-preset", "veryfast",
+             *mp4_movflags(output_path), output_path]
+    run_ffmpeg(args)
+    return output_path
+
+
+# Render a story made of (audio_path, image_path, duration) frames straight with ffmpeg.
+# audio_path may be None for silent slideshows (then it must be None for every frame).
+# By default every image is scaled to the first one's size, like concatenate_videoclips.
+# With height set, images are scaled to that height and centered on a black canvas
+# as wide as the widest one, like resize(height=...) + method="compose".
+def render_still_timeline(frames, output_path, height=None, fps=RENDER_FPS):
+    frames = list(frames)
+    sizes = [media_probe.dimensions(image_path) for _, image_path, _ in frames]
+
+    if height:
+        width = _even(max(w * height / h for w, h in sizes) + 1)
+        height = _even(height)
+        video_filter = f"scale=-2:{height},pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:black"
+    else:
+        width, height = _even(sizes[0][0]), _even(sizes[0][1])
+        video_filter = f"scale={width}:{height}"
+
+    def render(frame, segment_path):
+        audio_path, image_path, duration = frame
+        return render_still_segment(image_path, audio_path, duration, segment_path, video_filter, fps)
+
+    return render_segments(render, frames, output_path)
+
+
+# Render a story made of {"audio_path", "video_path", "duration"} clips with ffmpeg.
+# Each clip is cut or frozen to its narration and centred on a canvas as large as the
+# largest clip, like concatenate_videoclips(method="compose").
+def render_broll_timeline(clips, output_path, fps=RENDER_FPS):
+    clips = list(clips)
+    sizes = [media_probe.dimensions(clip["video_path"]) for clip in clips]
+    canvas_size = (_even(max(w for w, _ in sizes) + 1), _even(max(h for _, h in sizes) + 1))
+
+    def render(clip, segment_path):
+        return render_broll_segment(clip["video_path"], clip["audio_path"], clip["duration"], canvas_size, segment_path, fps)
+
+    return render_segments(render, clips, output_path)
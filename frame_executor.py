@@ -0,0 +1,20 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of frames processed at the same time per request
+FRAME_WORKERS = int(os.getenv("FRAME_WORKERS", "4"))
+
+
+# Run func on every item with bounded concurrency and return the results in item order
+def map_frames(func, items, max_workers=None):
+    items = list(items)
+    if not items:
+        return []
+
+    workers = min(max_workers or FRAME_WORKERS, len(items))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame") as executor:
+        # Each frame runs in a copy of the caller's context so per-request flags carry over.
+        # executor.map yields in submission order and re-raises the first failure
+        contexts = [contextvars.copy_context() for _ in items]
+        return list(executor.map(lambda context, item: context.run(func, item), contexts, items))
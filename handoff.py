@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from urllib.parse import urlparse
+
+import http_pool
+import s3_transfer
+
+# Services on this node that take videos as node-local paths, as host:port entries,
+# e.g. LOCAL_SERVICES=34.1.2.3:7020,34.1.2.3:7035 (the addresses callers already use).
+# Videos for any other service still go through S3.
+LOCAL_SERVICES = {entry.strip() for entry in os.getenv("LOCAL_SERVICES", "").split(",") if entry.strip()}
+# Shared by every service on the node; hand-off files nobody picked up are removed after HANDOFF_TTL seconds
+HANDOFF_DIR = os.getenv("HANDOFF_DIR", os.path.join(tempfile.gettempdir(), "all_apis_handoff"))
+HANDOFF_TTL = int(os.getenv("HANDOFF_TTL", "3600"))
+
+
+def is_local(service_url):
+    return urlparse(service_url).netloc in LOCAL_SERVICES
+
+
+# Request fields asking a service on this node to answer with {"video_path": ...}
+# instead of uploading its result; services pass the flag on to the one they chain to
+def reply_fields(service_url):
+    return {"handoff": "local"} if is_local(service_url) else {}
+
+
+def wants_local_reply(data):
+    return data.get("handoff") == "local"
+
+
+# The video fields of a request or response, {"video_path": ...} or {"video_url": ...}
+def video_fields(payload):
+    return {key: payload[key] for key in ("video_path", "video_url") if payload.get(key)}
+
+
+def _sweep():
+    cutoff = time.time() - HANDOFF_TTL
+    for entry in os.scandir(HANDOFF_DIR):
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# Fresh path in HANDOFF_DIR for a file another service on this node will pick up
+def new_path(suffix=".mp4"):
+    os.makedirs(HANDOFF_DIR, exist_ok=True)
+    _sweep()
+    return os.path.join(HANDOFF_DIR, f"{uuid.uuid4()}{suffix}")
+
+
+# Produce a video for the service at service_url and return the request fields that
+# point it there. write(output_path) renders the video to output_path, a scratch
+# path of the caller. A local service gets {"video_path": ...}: the finished file is
+# moved into HANDOFF_DIR and nothing touches S3. A remote one gets {"video_url": ...},
+# uploaded to bucket/key (while it is written with stream=True, see
+# s3_transfer.upload_while_writing).
+def send_video(write, service_url, output_path, bucket, key, stream=False):
+    if is_local(service_url):
+        # Only the finished file lands in HANDOFF_DIR, whatever write() leaves next to it stays with the caller
+        write(output_path)
+        video_path = new_path(os.path.splitext(output_path)[1])
+        shutil.move(output_path, video_path)
+        print(f"Handing {video_path} to {service_url}")
+        return {"video_path": video_path}
+    return {"video_url": s3_transfer.upload_while_writing(write, output_path, bucket, key, stream=stream)}
+
+
+# Put the video described by fields ({"video_path"} or {"video_url"}, from a request
+# or a response) at output_path. A hand-off file is moved, so it is gone from
+# HANDOFF_DIR once taken; anything else is downloaded.
+def receive_video(fields, output_path):
+    video_path = fields.get("video_path")
+    if video_path:
+        handoff_dir = os.path.realpath(HANDOFF_DIR)
+        if os.path.dirname(os.path.realpath(video_path)) != handoff_dir:
+            raise ValueError(f"{video_path} is not a hand-off file")
+        shutil.move(video_path, output_path)
+        return output_path
+
+    response = http_pool.get(fields["video_url"], stream=True)
+    response.raise_for_status()
+    with open(output_path, "wb") as video_file:
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            video_file.write(chunk)
+    return output_path
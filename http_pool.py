@@ -0,0 +1,80 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+from flask import jsonify
+from requests.adapters import HTTPAdapter
+
+# Connections kept open per host, roughly the number of concurrent calls to it
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+# (connect, read) timeouts for provider calls and downloads
+DEFAULT_TIMEOUT = (
+    float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+    float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+)
+# Our own services render whole videos before they answer
+SERVICE_TIMEOUT = (DEFAULT_TIMEOUT[0], float(os.getenv("SERVICE_READ_TIMEOUT", "1800")))
+
+_sessions = {}
+_request_counts = {}
+_lock = threading.Lock()
+
+
+def _origin(url):
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+# One keep-alive session per scheme://host, so repeated calls to a provider skip the
+# TCP and TLS handshakes. Sessions are shared by every thread of the service.
+def session_for(url):
+    origin = _origin(url)
+    with _lock:
+        session = _sessions.get(origin)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[origin] = session
+        _request_counts[origin] = _request_counts.get(origin, 0) + 1
+    return session
+
+
+# Same arguments as requests.request, with DEFAULT_TIMEOUT unless a timeout is given
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return session_for(url).request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+# Requests sent and connections opened per host; every request beyond the
+# connection count went over a connection that was already open
+def connection_stats():
+    stats = {}
+    with _lock:
+        sessions = list(_sessions.items())
+        counts = dict(_request_counts)
+    for origin, session in sessions:
+        pools = session.get_adapter(origin).poolmanager.pools
+        connections = sum(pool.num_connections for pool in map(pools.get, pools.keys()) if pool)
+        stats[origin] = {
+            "requests": counts.get(origin, 0),
+            "connections": connections,
+            "reused": max(counts.get(origin, 0) - connections, 0),
+        }
+    return stats
+
+
+def register_http_stats_route(app):
+    @app.route('/http-stats', methods=['GET'])
+    def http_stats():
+        return jsonify(connection_stats()), 200
@@ -1,10 +1,9 @@
 import os
-import boto3
+import s3_transfer
 from PIL import Image
-import requests
+import http_pool
 from io import BytesIO
-import asyncio
-import fal_client
+from fal_jobs import FAL_WEBHOOK_PORT, run_fal_job, start_webhook_server
 
 # AWS credentials and S3 bucket details from environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -13,13 +12,8 @@ s3_bucket_name = os.getenv("S3_BUCKET_NAME")
 aws_region = os.getenv("AWS_REGION")  # e.g., 'us-east-1'
 
 def upload_file_to_s3(file_path, bucket_name, s3_filename):
-    s3 = boto3.client('s3',
-                      region_name=aws_region,
-                      aws_access_key_id=aws_access_key,
-                      aws_secret_access_key=aws_secret_key)
     try:
-        s3.upload_file(file_path, bucket_name, s3_filename)
-        s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_filename}"
+        s3_url = s3_transfer.upload_file(file_path, bucket_name, s3_filename)
         print(f"File uploaded to {s3_url}")
         return s3_url
     except FileNotFoundError:
@@ -31,8 +25,8 @@ def upload_file_to_s3(file_path, bucket_name, s3_filename):
 
 def combine_images_and_upload(url1, url2):
     # Load images from URLs
-    response1 = requests.get(url1)
-    response2 = requests.get(url2)
+    response1 = http_pool.get(url1)
+    response2 = http_pool.get(url2)
     img1 = Image.open(BytesIO(response1.content))
     img2 = Image.open(BytesIO(response2.content))
     
@@ -60,42 +54,15 @@ def combine_images_and_upload(url1, url2):
     return combined_image_url
 
 # Function to create a video from the image URL
-async def image_to_video(image_url):
-    # Submit the request to create the video
-    handler = await fal_client.submit_async(
+def image_to_video(image_url):
+    # Completion arrives via fal webhook when configured, polling is the fallback
+    result = run_fal_job(
         "fal-ai/kling-video/v1/standard/image-to-video",
-        arguments={
+        {
             "prompt": "there are two people in the image, make them hug",
             "image_url": image_url
         },
-        webhook_url=None,
     )
-
-    request_id = handler.request_id
-    print("Request ID:", request_id)
-    result_fetched = False
-        # Continuously check the status until it's completed
-    while not result_fetched:
-        status = await fal_client.status_async("fal-ai/kling-video/v1/standard/text-to-video", request_id, with_logs=True)
-        print(f"Current Status: {status}")  # Print the status object for debugging
-        
-        # Check for various possible status states
-        if "Completed" in str(status):
-            print("Request completed.")
-            result_fetched = True
-        elif "Failed" in str(status):
-            raise Exception("Request failed.")
-        elif "Queued" in str(status):
-            print("Request is still in queue...")
-        elif "InProgress" in str(status):
-            print("Request is currently running...")
-    
-
-        
-        await asyncio.sleep(2)  # Wait for 2 seconds before checking again
-        
-    # Fetch the final result
-    result = await fal_client.result_async("fal-ai/kling-video/v1/standard/image-to-video", request_id)
     video_url = result['video']['url']
     print("Video URL:", video_url)
     return video_url, result
@@ -107,8 +74,12 @@ combined_image_url = combine_images_and_upload("https://img.freepik.com/free-pho
 '''
 combined_image_url= "https://mygenerateddatabucket.s3.eu-north-1.amazonaws.com/combined_image.png"
 '''
+# Receive fal webhooks in-process when a port is configured
+if FAL_WEBHOOK_PORT:
+    start_webhook_server()
+
 # Run the image_to_video function and retrieve the video URL
-video_url, video_response = asyncio.run(image_to_video(combined_image_url))
+video_url, video_response = image_to_video(combined_image_url)
 print("The final video URL is:", video_url)
 print("The full response object is:", video_response)
 
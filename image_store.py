@@ -0,0 +1,57 @@
+import os
+from urllib.parse import urlparse
+
+import http_pool
+from asset_store import AssetStore, asset_key, place_file
+from llm_cache import bypass_cache
+
+# Set IMAGE_CACHE_ENABLED=0 to always generate new images (they are still stored)
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "1") == "1"
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+image_cache = AssetStore("images", max_bytes=IMAGE_CACHE_MAX_BYTES)
+
+
+def _suffix(image_url):
+    return os.path.splitext(urlparse(image_url).path)[1] or ".png"
+
+
+# Local path of the image generated for (model, prompt, size, seed).
+# generate() is only called on a miss and returns the provider's URL. Those URLs
+# expire, so the image is downloaded right away, exactly once, and kept on disk for
+# every later request with the same prompt. With output_path set the image is also
+# placed there and output_path is returned instead of the path in the store.
+def cached_image(model, prompt, generate, size=None, seed=None, output_path=None):
+    key = asset_key(model=model, prompt=prompt, size=size, seed=seed)
+
+    found = None
+    if IMAGE_CACHE_ENABLED and not bypass_cache.get():
+        found = image_cache.get(key)
+
+    if found:
+        stored_path = found[0]
+        print(f"Image for '{prompt}' reused from image cache")
+    else:
+        image_url = generate()
+        print("The image url is ", image_url)
+        response = http_pool.get(image_url)
+        response.raise_for_status()
+        stored_path = image_cache.put_bytes(key, response.content, _suffix(image_url), meta={"url": image_url})
+
+    if not output_path:
+        return stored_path
+    return place_file(stored_path, output_path)
+
+
+# Generate a DALL-E image for prompt and return its local path
+def generate_dalle_image(client, prompt, output_path=None, model="dall-e-3", size="1024x1024"):
+    def generate():
+        resp = client.images.generate(
+            model=model,
+            prompt=prompt,
+            n=1,
+            size=size
+        )
+        return resp.data[0].url
+
+    return cached_image(model, prompt, generate, size=size, output_path=output_path)
@@ -0,0 +1,232 @@
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from flask import jsonify, request
+
+import result_cache
+from llm_cache import bypass_cache
+
+# Number of pipelines a single service runs in the background at once
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "86400"))
+# Set COALESCE_REQUESTS=0 to run every request on its own, even identical concurrent ones
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+
+
+# Single-flight: while func runs for a key, other callers with the same key wait for
+# that run and get its result (or its exception) instead of starting their own
+class SingleFlight:
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def run(self, key, func, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+        if not leader:
+            print("Identical request already running, waiting for its result")
+            return call.result()
+
+        try:
+            result = func(*args, **kwargs)
+            call.set_result(result)
+            return result
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+# Background worker pool plus an in-memory table of job states
+class JobQueue:
+    def __init__(self, max_workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or JOB_WORKERS, thread_name_prefix="job")
+        self.jobs = {}
+        # Reentrant so submit_once can call submit while holding it
+        self.lock = threading.RLock()
+        self.flight = SingleFlight()
+        self.job_keys = {}  # request key -> id of the queued or running job for it
+
+    def _add_job(self, **fields):
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "http_status": None,
+            "result": None,
+            "error": None,
+            **fields,
+        }
+        with self.lock:
+            self._expire_finished_jobs()
+            self.jobs[job_id] = job
+        return job_id
+
+    # Queue func(*args, **kwargs) and return its job id immediately
+    def submit(self, func, *args, **kwargs):
+        job_id = self._add_job()
+        # Run in a copy of the caller's context so per-request flags follow the job
+        context = contextvars.copy_context()
+        self.executor.submit(context.run, self._run, job_id, func, args, kwargs)
+        print(f"Job {job_id} queued")
+        return job_id
+
+    # Like submit, but a request with the same key as a queued or running job gets that job's id
+    def submit_once(self, key, func, *args, **kwargs):
+        with self.lock:
+            job_id = self.job_keys.get(key)
+            if job_id:
+                print(f"Job {job_id} already runs this request, attaching to it")
+                return job_id
+            job_id = self.submit(self.flight.run, key, func, *args, **kwargs)
+            self.job_keys[key] = job_id
+            return job_id
+
+    # Record a job that is already done, e.g. a request answered from the result cache
+    def add_completed(self, payload, http_status):
+        now = time.time()
+        job_id = self._add_job(status="completed", started_at=now, finished_at=now,
+                               http_status=http_status, result=payload)
+        print(f"Job {job_id} completed from stored result")
+        return job_id
+
+    # Pipelines return (payload, http_status) just like the Flask handlers
+    def _run(self, job_id, func, args, kwargs):
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            payload, http_status = func(*args, **kwargs)
+            status = "completed" if http_status < 400 else "failed"
+            self._update(job_id, status=status, result=payload, http_status=http_status)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), http_status=500)
+        finally:
+            with self.lock:
+                self.jobs[job_id]["finished_at"] = time.time()
+                for key in [key for key, running_id in self.job_keys.items() if running_id == job_id]:
+                    del self.job_keys[key]
+        print(f"Job {job_id} finished")
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _expire_finished_jobs(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self.jobs.items()
+                   if job["finished_at"] and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    # Return a snapshot of the job, or None for unknown ids
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+
+# Callers opt in with {"async": true} in the body or ?async=1 on the URL
+def is_async_request(data):
+    flag = (data or {}).get("async", request.args.get("async", False))
+    if isinstance(flag, str):
+        return flag.lower() in ("1", "true", "yes")
+    return bool(flag)
+
+
+def job_urls(job_id):
+    return {
+        "status_url": f"{request.host_url}jobs/{job_id}",
+        "result_url": f"{request.host_url}jobs/{job_id}/result",
+    }
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+# Same service script, pipeline and arguments modulo whitespace -> same key.
+# The script is part of it because every service shares the result cache and
+# several of them name their pipeline the same (run_image_story, ...).
+def request_key(func, args, kwargs):
+    script = getattr(sys.modules.get(func.__module__), "__file__", None) or func.__module__
+    payload = json.dumps(
+        [os.path.basename(script), func.__qualname__, [_normalize(arg) for arg in args],
+         {name: _normalize(value) for name, value in kwargs.items()}],
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Submit the pipeline for async callers, otherwise run it inline as before.
+# Exact repeats of a finished request get its stored result right away, sync or
+# async, unless they ask for a fresh one. Identical requests in flight at the
+# same time share one run.
+def run_or_submit(queue, data, func, *args, **kwargs):
+    key = request_key(func, args, kwargs)
+
+    if not result_cache.is_fresh_request(data):
+        found = result_cache.lookup(key)
+        if found:
+            payload, http_status = found
+            if is_async_request(data):
+                # Async callers still get a job, one that is already done
+                job_id = queue.add_completed(payload, http_status)
+                return jsonify({"job_id": job_id, "status": "completed", **job_urls(job_id)}), 202
+            return jsonify(payload), http_status
+
+    pipeline = functools.partial(result_cache.run_and_store, key, func)
+    # Requests with no_cache only share a run with each other
+    flight_key = f"{key}:{bypass_cache.get()}" if COALESCE_REQUESTS else None
+
+    if is_async_request(data):
+        if flight_key:
+            job_id = queue.submit_once(flight_key, pipeline, *args, **kwargs)
+        else:
+            job_id = queue.submit(pipeline, *args, **kwargs)
+        return jsonify({"job_id": job_id, "status": queue.get(job_id)["status"], **job_urls(job_id)}), 202
+
+    if flight_key:
+        payload, http_status = queue.flight.run(flight_key, pipeline, *args, **kwargs)
+    else:
+        payload, http_status = pipeline(*args, **kwargs)
+    return jsonify(payload), http_status
+
+
+# Add GET /jobs/<job_id> and GET /jobs/<job_id>/result to a Flask app
+def register_job_routes(app, queue):
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def job_status(job_id):
+        job = queue.get(job_id)
+        if not job:
+            return jsonify({"error": "Unknown job id"}), 404
+        job.update(job_urls(job_id))
+        return jsonify(job), 200
+
+    @app.route('/jobs/<job_id>/result', methods=['GET'])
+    def job_result(job_id):
+        job = queue.get(job_id)
+        if not job:
+            return jsonify({"error": "Unknown job id"}), 404
+        if job["status"] in ("queued", "running"):
+            return jsonify({"job_id": job_id, "status": job["status"], **job_urls(job_id)}), 202
+        if job["error"]:
+            return jsonify({"error": job["error"]}), job["http_status"]
+        return jsonify(job["result"]), job["http_status"]
@@ -0,0 +1,103 @@
+import os
+
+import cv2
+import numpy as np
+from moviepy.editor import VideoClip
+
+import media_probe
+from ffmpeg_render import render_segments
+
+# "linear" or "ease_in_out"
+KEN_BURNS_EASING = os.getenv("KEN_BURNS_EASING", "linear")
+
+EASINGS = {
+    "linear": lambda p: p,
+    # smoothstep: starts and ends at rest, no jolt at clip boundaries
+    "ease_in_out": lambda p: p * p * (3 - 2 * p),
+}
+
+
+# Crop window (x, y, width, height) in source pixels for each of n_frames frames.
+# zoom is how much the window is magnified (1.1 = window is 1/1.1 of the image);
+# pan_start/pan_end place the window inside the remaining margin, (0, 0) being the
+# top-left corner and (1, 1) the bottom-right one. All values are floats, so the
+# window moves by fractions of a pixel instead of snapping to whole pixels.
+def crop_windows(size, n_frames, zoom_start=1.1, zoom_end=1.1, pan_start=(0.0, 0.0), pan_end=(1.0, 1.0), easing=None):
+    width, height = size
+    progress = np.linspace(0.0, 1.0, n_frames) if n_frames > 1 else np.zeros(1)
+    progress = EASINGS[easing or KEN_BURNS_EASING](progress)
+
+    zoom = zoom_start + (zoom_end - zoom_start) * progress
+    crop_w = width / zoom
+    crop_h = height / zoom
+    pan_x = pan_start[0] + (pan_end[0] - pan_start[0]) * progress
+    pan_y = pan_start[1] + (pan_end[1] - pan_start[1]) * progress
+
+    return np.stack([(width - crop_w) * pan_x, (height - crop_h) * pan_y, crop_w, crop_h], axis=1)
+
+
+# Cut one window out of the image and scale it to out_size with a single bilinear resample
+def render_window(image, window, out_size):
+    x, y, crop_w, crop_h = window
+    out_w, out_h = out_size
+    scale_x = out_w / crop_w
+    scale_y = out_h / crop_h
+    # Maps pixel centres, so a window at x=0.5 really is half a pixel to the right
+    matrix = np.float32([
+        [scale_x, 0, scale_x * (0.5 - x) - 0.5],
+        [0, scale_y, scale_y * (0.5 - y) - 0.5],
+    ])
+    return cv2.warpAffine(image, matrix, (out_w, out_h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+# Pan/zoom clip over a still image. Windows for the whole segment are computed up front
+# and every frame is produced by one warpAffine of the original image, so no per-frame
+# resize of the full picture and no Python-level slicing. With canvas_size set, the
+# frames are centred on a black canvas of that size.
+def ken_burns_clip(image_path, duration, fps=24, zoom_start=1.1, zoom_end=1.1,
+                   pan_start=(0.0, 0.0), pan_end=(1.0, 1.0), easing=None, canvas_size=None):
+    image = cv2.cvtColor(cv2.imread(image_path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    height, width = image.shape[:2]
+
+    n_frames = max(1, int(round(duration * fps)))
+    windows = crop_windows((width, height), n_frames, zoom_start, zoom_end, pan_start, pan_end, easing)
+
+    canvas = None
+    if canvas_size and tuple(canvas_size) != (width, height):
+        canvas = np.zeros((canvas_size[1], canvas_size[0], 3), dtype=np.uint8)
+        left = (canvas_size[0] - width) // 2
+        top = (canvas_size[1] - height) // 2
+
+    def make_frame(t):
+        index = min(int(t * fps + 1e-6), n_frames - 1)
+        frame = render_window(image, windows[index], (width, height))
+        if canvas is None:
+            return frame
+        framed = canvas.copy()
+        framed[top:top + height, left:left + width] = frame
+        return framed
+
+    clip = VideoClip(make_frame, duration=duration)
+    clip.fps = fps
+    return clip
+
+
+# Write one pan/zoom segment. Module-level so a process pool can pickle it.
+def render_ken_burns_segment(item, output_path):
+    image_path, duration, zoom_factor, easing, canvas_size = item
+    clip = ken_burns_clip(image_path, duration, zoom_start=zoom_factor, zoom_end=zoom_factor,
+                          easing=easing, canvas_size=canvas_size)
+    clip.write_videofile(output_path, fps=clip.fps, codec="libx264", audio=False, logger=None)
+    return output_path
+
+
+# Pan/zoom every image in order into one video. Segments are rendered in a process
+# pool, one per core, and joined without re-encoding. Images of different sizes are
+# centred on a canvas as large as the largest one, like method="compose".
+def render_ken_burns_video(image_paths, output_path, duration=1.5, zoom_factor=1.1, easing=None):
+    sizes = [media_probe.dimensions(image_path) for image_path in image_paths]
+    # Even sizes keep every segment yuv420p, so they concat as they are
+    canvas_size = tuple(max(dim) + max(dim) % 2 for dim in zip(*sizes))
+
+    items = [(image_path, duration, zoom_factor, easing, canvas_size) for image_path in image_paths]
+    return render_segments(render_ken_burns_segment, items, output_path, use_processes=True)
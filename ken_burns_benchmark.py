@@ -0,0 +1,64 @@
+#Use moviepy version - pip install moviepy==1.0.3
+# Frames per second of the old moviepy pan_zoom callback against the ken_burns engine.
+# Usage: python ken_burns_benchmark.py [image_path] [duration_seconds]
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from moviepy.editor import ImageClip
+
+from ken_burns import ken_burns_clip
+
+FPS = 24
+
+
+# The add_pan_zoom_effect that top5 used before ken_burns, kept here as the baseline
+def legacy_pan_zoom_clip(image_path, duration=1.5, zoom_factor=1.1):
+    clip = ImageClip(image_path).set_duration(duration)
+    w, h = clip.size
+    new_w, new_h = int(w * zoom_factor), int(h * zoom_factor)
+
+    zoomed_clip = clip.resize(newsize=(new_w, new_h))
+
+    def pan_zoom(get_frame, t):
+        frame = get_frame(t)
+        h, w, _ = frame.shape
+        x_shift = int((new_w - w) * (t / duration))
+        y_shift = int((new_h - h) * (t / duration))
+        return frame[y_shift:y_shift + h, x_shift:x_shift + w]
+
+    return zoomed_clip.fl(pan_zoom)
+
+
+# Pull every frame the writer would request and return frames per second
+def measure(clip, duration):
+    times = np.arange(0, duration, 1.0 / FPS)
+    start = time.perf_counter()
+    for t in times:
+        clip.get_frame(t)
+    return len(times) / (time.perf_counter() - start)
+
+
+def main():
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    if len(sys.argv) > 1:
+        image_path = sys.argv[1]
+    else:
+        # DALL-E sized noise image, detailed enough that resampling cost is realistic
+        image_path = os.path.join(tempfile.gettempdir(), "ken_burns_benchmark.png")
+        noise = np.random.default_rng(0).integers(0, 256, (1024, 1024, 3), dtype=np.uint8)
+        cv2.imwrite(image_path, noise)
+
+    legacy_fps = measure(legacy_pan_zoom_clip(image_path, duration), duration)
+    print(f"legacy callback:        {legacy_fps:8.1f} frames/s")
+
+    for easing in ["linear", "ease_in_out"]:
+        engine_fps = measure(ken_burns_clip(image_path, duration, fps=FPS, easing=easing), duration)
+        print(f"ken_burns {easing:<12}  {engine_fps:8.1f} frames/s  ({engine_fps / legacy_fps:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from flask import request
+
+from asset_store import CACHE_DIR
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(CACHE_DIR, "llm_cache.sqlite3"))
+# Set LLM_CACHE_ENABLED=0 to always call the API
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+# Entries older than this are fetched again (default 7 days)
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+# Least recently used entries beyond this count are evicted
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+
+# True while serving a request that asked for fresh generations
+bypass_cache = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def _database():
+    os.makedirs(os.path.dirname(LLM_CACHE_PATH) or ".", exist_ok=True)
+    connection = sqlite3.connect(LLM_CACHE_PATH, timeout=30)
+    # WAL lets every service on the box read while one of them writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, last_used_at REAL)"
+            )
+            yield connection
+    finally:
+        connection.close()
+
+
+# Same model, options and prompt modulo whitespace -> same key
+def cache_key(model, messages, **options):
+    normalized = [
+        {"role": str(message["role"]).strip().lower(), "content": " ".join(str(message["content"]).split())}
+        for message in messages
+    ]
+    payload = json.dumps({"model": model, "messages": normalized, "options": options}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _lookup(key):
+    with _database() as connection:
+        row = connection.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        if time.time() - row[1] > LLM_CACHE_TTL:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+
+def _store(key, model, response):
+    now = time.time()
+    with _database() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+            (key, model, response, now, now)
+        )
+        connection.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (LLM_CACHE_MAX_ENTRIES,)
+        )
+
+
+def _forget(key):
+    with _database() as connection:
+        connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+
+# Drop-in for client.chat.completions.create(...).choices[0].message.content.
+# parse, e.g. ast.literal_eval, turns the text into the value the caller needs;
+# a response is only stored once it parsed, so a malformed answer is never replayed.
+def chat_completion(client, model, messages, parse=None, **kwargs):
+    use_cache = LLM_CACHE_ENABLED and not bypass_cache.get()
+    key = cache_key(model, messages, **kwargs) if LLM_CACHE_ENABLED else None
+
+    if use_cache:
+        response = _lookup(key)
+        if response is not None:
+            print(f"LLM cache hit for {model}")
+            try:
+                return parse(response) if parse else response
+            except Exception:
+                _forget(key)
+
+    completion = client.chat.completions.create(model=model, messages=messages, **kwargs)
+    response = completion.choices[0].message.content
+    result = parse(response) if parse else response
+
+    # Bypassed requests still refresh the entry for the next caller
+    if LLM_CACHE_ENABLED:
+        _store(key, model, response)
+    return result
+
+
+def _is_set(flag):
+    if isinstance(flag, str):
+        return flag.lower() in ("1", "true", "yes")
+    return bool(flag)
+
+
+# Callers skip cached generations with {"no_cache": true} in the body or ?no_cache=1.
+# The flag rides along in the context, so background jobs started by the request see it too.
+def register_cache_bypass(app):
+    @app.before_request
+    def read_cache_bypass():
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = {}
+        bypass_cache.set(_is_set(data.get("no_cache", request.args.get("no_cache", False))))
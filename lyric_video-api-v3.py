@@ -1,11 +1,12 @@
 from flask import Flask, request, jsonify
-import requests
-import moviepy.editor as mp
-import boto3
+import http_pool
+import handoff
 import os
 from uuid import uuid4
+from ffmpeg_render import replace_audio
 
 app = Flask(__name__)
+http_pool.register_http_stats_route(app)
 
 # Load environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -13,14 +14,8 @@ aws_secret_key = os.getenv("AWS_SECRET_KEY")
 s3_bucket_name = os.getenv("S3_BUCKET_NAME", "mygenerateddatabucket")
 aws_region = os.getenv("AWS_REGION", "eu-north-1")
 external_ip = os.getenv("EXTERNAL_IP")
-
-# AWS S3 configuration
-s3_client = boto3.client(
-    "s3",
-    region_name=aws_region,
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key
-)
+video_story_url = f"http://{external_ip}:7035/video-story"
+caption_api_url = f"http://{external_ip}:7020/caption_video"
 
 # Endpoint to handle video generation and audio merging
 @app.route('/create-video-with-audio', methods=['POST'])
@@ -31,54 +26,49 @@ def create_video_with_audio():
     topic = data.get("topic")
     num_frames = data.get("num_frames")
 
-    # Step 1: Request video generation
-    response = requests.post(f"http://{external_ip}:7035/video-story", json={"topic": topic, "num_frames": num_frames})
+    # Step 1: Request video generation. On this node it comes back as a local path
+    response = http_pool.post(video_story_url, json={"topic": topic, "num_frames": num_frames, **handoff.reply_fields(video_story_url)},
+                             timeout=http_pool.SERVICE_TIMEOUT)
     if response.status_code != 200:
         return jsonify({"error": "Failed to generate video"}), 500
 
-    video_url = response.json().get("video_url")
-    print(f"Video URL: {video_url}")
+    video = handoff.video_fields(response.json())
+    print(f"Video: {video}")
 
     # Step 2: Download video and audio
     video_filename = f"/tmp/{uuid4()}.mp4"
     audio_filename = f"/tmp/{uuid4()}.mp3"
     combined_filename = f"/tmp/{uuid4()}_combined.mp4"
 
-    # Download video
-    video_data = requests.get(video_url)
-    with open(video_filename, 'wb') as f:
-        f.write(video_data.content)
+    # Take over the hand-off file, or download the video
+    handoff.receive_video(video, video_filename)
 
     # Download audio
-    audio_data = requests.get(audio_url)
+    audio_data = http_pool.get(audio_url)
     with open(audio_filename, 'wb') as f:
         f.write(audio_data.content)
 
-    # Step 3: Load video and audio, mute video, and combine
-    video_clip = mp.VideoFileClip(video_filename).without_audio()
-    audio_clip = mp.AudioFileClip(audio_filename)
-
-    # Truncate audio or video to the shortest duration
-    min_duration = min(video_clip.duration, audio_clip.duration)
-    final_video = video_clip.subclip(0, min_duration).set_audio(audio_clip.subclip(0, min_duration))
-    final_video.write_videofile(combined_filename, codec="libx264", audio_codec="aac")
-
-    # Step 4: Upload the combined video to S3
+    # Step 3: Swap the video's audio for the song, truncated to the shorter of the two.
+    # The video stream is copied as is, only the audio is encoded.
+    # Step 4: The result goes to captioning as a local file on this node, through S3 otherwise
     s3_key = f"videos/{uuid4()}_final_combined_video.mp4"
-    s3_client.upload_file(combined_filename, s3_bucket_name, s3_key)
-    combined_video_url = f"https://{s3_bucket_name}.s3.{aws_region}.amazonaws.com/{s3_key}"
-    print(f"Final Combined Video URL: {combined_video_url}")
-
-    # Clean up temporary files
-    os.remove(video_filename)
-    os.remove(audio_filename)
-    os.remove(combined_filename)
-
-    # Step 5: Send combined video URL to captioning API
-    caption_response = requests.post(
-        f"http://{external_ip}:7020/caption_video",
-        json={"video_url": combined_video_url},
-        headers={"Content-Type": "application/json"}
+    combined_video = handoff.send_video(
+        lambda output_path: replace_audio(video_filename, audio_filename, output_path, trim_to_shortest=True),
+        caption_api_url, combined_filename, s3_bucket_name, s3_key
+    )
+    print(f"Final Combined Video: {combined_video}")
+
+    # Clean up temporary files (the combined video is only on disk if it was written for S3 without streaming)
+    for path in (video_filename, audio_filename, combined_filename):
+        if os.path.exists(path):
+            os.remove(path)
+
+    # Step 5: Send combined video to captioning API
+    caption_response = http_pool.post(
+        caption_api_url,
+        json=combined_video,
+        headers={"Content-Type": "application/json"},
+        timeout=http_pool.SERVICE_TIMEOUT
     )
 
     # Check if the captioning API request was successful
@@ -2,14 +2,12 @@ import asyncio
 import os
 import re
 import uuid
-import requests
-import json
 import boto3
 from moviepy.editor import VideoFileClip, concatenate_videoclips, AudioFileClip
 from pydub import AudioSegment
 import openai
-from elevenlabs import ElevenLabs
-from fal_client import submit_async, status_async, result_async
+import tts_client
+from fal_jobs import FAL_WEBHOOK_PORT, await_fal_job, start_webhook_server
 
 # Initialize environment variables
 aws_access_key = os.getenv("AWS_ACCESS_KEY")
@@ -17,31 +15,13 @@ aws_secret_key = os.getenv("AWS_SECRET_KEY")
 s3_bucket_name = os.getenv("S3_BUCKET_NAME")
 aws_region = os.getenv("AWS_REGION")
 openai_api_key = os.getenv("OPENAI_API_KEY")
-elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
 
-# Initialize OpenAI and ElevenLabs clients
+# Initialize OpenAI client
 client = openai.OpenAI(api_key=openai_api_key)
-elevenlabs_client = ElevenLabs(api_key=elevenlabs_api_key)
 
 async def text_to_video_Kling(prompt, webhook_url=None):
-    handler = await submit_async(
-        "fal-ai/kling-video/v1/standard/text-to-video",
-        arguments={"prompt": prompt},
-        webhook_url=webhook_url
-    )
-    request_id = handler.request_id
-    print(f"Request ID: {request_id}")
-
-    # Check the status until the video is completed
-    while True:
-        status = await status_async("fal-ai/kling-video/v1/standard/text-to-video", request_id, with_logs=True)
-        if hasattr(status, 'status') and status.status == "Completed":
-            break
-        elif hasattr(status, 'status') and status.status == "Failed":
-            raise Exception("Video generation failed.")
-        await asyncio.sleep(2)
-    
-    result = await result_async("fal-ai/kling-video/v1/standard/text-to-video", request_id)
+    # Completion arrives via fal webhook when configured, polling is the fallback
+    result = await await_fal_job("fal-ai/kling-video/v1/standard/text-to-video", {"prompt": prompt}, webhook_url=webhook_url)
     return result['video_url']
 
 def generate_prompts(topic, num_prompts):
@@ -57,18 +37,9 @@ def generate_prompts(topic, num_prompts):
     return [prompt.strip() for prompt in prompts[:num_prompts]]
 
 def create_voiceover(text):
-    url = "https://api.elevenlabs.io/v1/text-to-speech/TlLWC5O5AUzxAg7ysFZB"
-    headers = {"Content-Type": "application/json", "xi-api-key": elevenlabs_api_key}
-    data = {"text": text, "voice_settings": {"stability": 0.1, "similarity_boost": 0}}
-
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    if response.status_code == 200:
-        audio_file = f"{uuid.uuid4()}.mp3"
-        with open(audio_file, "wb") as file:
-            file.write(response.content)
-        return audio_file
-    else:
-        raise Exception(f"Error {response.status_code}: {response.content}")
+    # Same voice and settings as the story services, so tts_client's defaults apply
+    audio_file, _ = tts_client.synthesize(text, f"{uuid.uuid4()}.mp3")
+    return audio_file
 
 def download_and_combine_videos(video_urls, audio_files, output_path="final_video.mp4"):
     clips = []
@@ -99,6 +70,10 @@ async def main():
     # Step 4: Combine videos and voiceovers into final video
     download_and_combine_videos(video_urls, audio_files)
 
+# Receive fal webhooks in-process when a port is configured
+if FAL_WEBHOOK_PORT:
+    start_webhook_server()
+
 # Run the main function
 asyncio.run(main())
 
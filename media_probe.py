@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict, namedtuple
+
+# Header-level facts about a media file. Fields that do not apply (e.g. width
+# for an MP3) are None.
+MediaInfo = namedtuple("MediaInfo", ["duration", "width", "height", "fps", "video_codec", "audio_codec"])
+
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY") or shutil.which("ffprobe")
+PROBE_CACHE_SIZE = int(os.getenv("PROBE_CACHE_SIZE", "1024"))
+# Still images have no duration, which moviepy's header parser treats as an error unless told not to
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _parse_rate(rate):
+    if not rate or rate == "0/0":
+        return None
+    num, _, den = rate.partition("/")
+    return float(num) / float(den or 1)
+
+
+# Read container and stream headers with ffprobe, nothing is decoded
+def _probe_ffprobe(path):
+    command = [
+        FFPROBE_BINARY, "-v", "error",
+        "-show_entries", "format=duration:stream=codec_type,codec_name,width,height,avg_frame_rate,duration",
+        "-of", "json", path
+    ]
+    output = subprocess.run(command, capture_output=True, check=True).stdout
+    data = json.loads(output)
+
+    video = next((s for s in data.get("streams", []) if s.get("codec_type") == "video"), {})
+    audio = next((s for s in data.get("streams", []) if s.get("codec_type") == "audio"), {})
+    duration = data.get("format", {}).get("duration") or video.get("duration") or audio.get("duration")
+
+    return MediaInfo(
+        duration=float(duration) if duration else None,
+        width=video.get("width"),
+        height=video.get("height"),
+        fps=_parse_rate(video.get("avg_frame_rate")),
+        video_codec=video.get("codec_name"),
+        audio_codec=audio.get("codec_name"),
+    )
+
+
+# Fallback when ffprobe is not installed: moviepy parses the header summary
+# that its bundled ffmpeg prints for "ffmpeg -i", which does not decode either
+def _probe_moviepy(path):
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    is_image = os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+    infos = ffmpeg_parse_infos(path, check_duration=not is_image)
+    width, height = infos.get("video_size") or (None, None)
+    return MediaInfo(
+        duration=infos.get("duration"),
+        width=width,
+        height=height,
+        fps=infos.get("video_fps"),
+        video_codec=None,
+        audio_codec=None,
+    )
+
+
+# Probe a file, memoized by (real path, size, mtime) so a rewritten file is probed again
+def probe(path):
+    stat = os.stat(path)
+    key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    info = _probe_ffprobe(path) if FFPROBE_BINARY else _probe_moviepy(path)
+
+    with _cache_lock:
+        _cache[key] = info
+        while len(_cache) > PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return info
+
+
+# Length of an audio or video file in seconds
+def duration(path):
+    return probe(path).duration
+
+
+# (width, height) of a video or image file
+def dimensions(path):
+    info = probe(path)
+    return info.width, info.height
@@ -0,0 +1,51 @@
+import json
+import os
+
+from flask import request
+
+from asset_store import AssetStore
+from llm_cache import bypass_cache
+
+# Set RESULT_CACHE_ENABLED=0 to run every request, even exact repeats (results are still stored)
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+# Finished results are served for this many seconds (default 1 day)
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(24 * 3600)))
+
+results = AssetStore("results", max_bytes=64 * 1024 ** 2, ttl=RESULT_CACHE_TTL)
+
+
+# Callers skip stored results with {"fresh": true} in the body or ?fresh=1
+def is_fresh_request(data):
+    flag = (data or {}).get("fresh", request.args.get("fresh", False))
+    if isinstance(flag, str):
+        return flag.lower() in ("1", "true", "yes")
+    return bool(flag)
+
+
+# (payload, http_status) stored for key, or None. Requests with no_cache never get one.
+def lookup(key):
+    if not RESULT_CACHE_ENABLED or bypass_cache.get():
+        return None
+    found = results.get(key)
+    if not found:
+        return None
+    try:
+        with open(found[0]) as result_file:
+            payload = json.load(result_file)
+    except (OSError, ValueError) as e:
+        # Evicted by another process since get(), or cut short; run the request again
+        print(f"Stored result for {key} is unreadable, ignoring it: {e}")
+        results.delete(key)
+        return None
+    print(f"Result reused from result cache: {payload}")
+    return payload, found[1]["http_status"]
+
+
+# Run func(*args, **kwargs), which returns (payload, http_status) like the Flask handlers,
+# and keep successful results for key. Payloads with an empty field, e.g. a failed
+# upload reported as {"s3_url": None}, are not kept.
+def run_and_store(key, func, *args, **kwargs):
+    payload, http_status = func(*args, **kwargs)
+    if http_status == 200 and isinstance(payload, dict) and all(value is not None for value in payload.values()):
+        results.put_bytes(key, json.dumps(payload).encode("utf-8"), ".json", meta={"http_status": http_status})
+    return payload, http_status
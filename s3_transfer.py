@@ -0,0 +1,188 @@
+import errno
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+# Point at an S3-compatible server (MinIO, LocalStack, ...) to run without AWS,
+# e.g. S3_ENDPOINT_URL=http://localhost:9000
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+AWS_REGION = os.getenv("AWS_REGION")
+# Files above one chunk go up as a multipart upload, S3_MAX_CONCURRENCY parts at a time
+S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "16"))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+# Files uploaded at once by upload_file_async (each of them uses S3_MAX_CONCURRENCY threads)
+S3_BACKGROUND_UPLOADS = int(os.getenv("S3_BACKGROUND_UPLOADS", "2"))
+# Set S3_STREAM_UPLOADS=0 to write every render to disk first and upload it afterwards
+S3_STREAM_UPLOADS = os.getenv("S3_STREAM_UPLOADS", "1") == "1"
+
+MB = 1024 ** 2
+
+transfer_config = TransferConfig(
+    multipart_threshold=S3_MULTIPART_CHUNK_MB * MB,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * MB,
+    max_concurrency=S3_MAX_CONCURRENCY,
+    use_threads=True,
+)
+
+_client = None
+_lock = threading.Lock()
+_background = ThreadPoolExecutor(max_workers=S3_BACKGROUND_UPLOADS, thread_name_prefix="s3-upload")
+
+
+# The process-wide S3 client. boto3 clients are thread-safe, so every request and
+# every part of a multipart upload shares it and its connection pool.
+def client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = boto3.client(
+                "s3",
+                region_name=AWS_REGION,
+                endpoint_url=S3_ENDPOINT_URL,
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_KEY"),
+                config=Config(
+                    max_pool_connections=S3_MAX_CONCURRENCY * (S3_BACKGROUND_UPLOADS + 1),
+                    # Local stand-ins do not serve bucket subdomains
+                    s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"},
+                ),
+            )
+        return _client
+
+
+# Public URL of bucket/key, on the stand-in when S3_ENDPOINT_URL is set
+def object_url(bucket, key):
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{bucket}/{key}"
+    return f"https://{bucket}.s3.{AWS_REGION}.amazonaws.com/{key}"
+
+
+# (bucket, key) of a URL returned by object_url
+def parse_url(url):
+    parsed = urlparse(url)
+    path = parsed.path.lstrip("/")
+    if S3_ENDPOINT_URL and url.startswith(S3_ENDPOINT_URL.rstrip("/") + "/"):
+        bucket, _, key = path.partition("/")
+        return bucket, key
+    return parsed.hostname.split(".")[0], path
+
+
+# Upload file_path to bucket/key with the shared client and transfer settings, return its URL.
+# Raises like client.upload_file (FileNotFoundError, NoCredentialsError, S3UploadFailedError).
+def upload_file(file_path, bucket, key, extra_args=None):
+    client().upload_file(file_path, bucket, key, ExtraArgs=extra_args, Config=transfer_config)
+    return object_url(bucket, key)
+
+
+# upload_file in the background. The returned future resolves to the URL,
+# or raises what upload_file raised.
+def upload_file_async(file_path, bucket, key, extra_args=None):
+    return _background.submit(upload_file, file_path, bucket, key, extra_args)
+
+
+def download_file(bucket, key, output_path):
+    client().download_file(bucket, key, output_path, Config=transfer_config)
+    return output_path
+
+
+# Multipart upload fed from a stream while its writer is still producing it.
+# Every S3_MULTIPART_CHUNK_MB read becomes a part, up to S3_MAX_CONCURRENCY parts are
+# in flight, and nothing is visible in the bucket until complete() is called.
+class MultipartUpload:
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = client().create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        self.parts = []
+        self.size = 0
+
+    def _upload_part(self, part_number, data):
+        response = client().upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=part_number, Body=data
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    # Upload everything in the file at path until its writer closes it. The file is
+    # read to the end even after a part failed, so a writer on a pipe never blocks;
+    # the first failure is raised afterwards.
+    def read_from(self, path):
+        in_flight = threading.BoundedSemaphore(S3_MAX_CONCURRENCY)
+        futures = []
+        with open(path, "rb") as stream, ThreadPoolExecutor(max_workers=S3_MAX_CONCURRENCY) as uploader:
+            while True:
+                data = stream.read(S3_MULTIPART_CHUNK_MB * MB)
+                if not data:
+                    break
+                self.size += len(data)
+                in_flight.acquire()
+                future = uploader.submit(self._upload_part, len(futures) + 1, data)
+                future.add_done_callback(lambda _: in_flight.release())
+                futures.append(future)
+        self.parts = [future.result() for future in futures]
+
+    def complete(self):
+        if not self.parts:
+            raise Exception(f"Nothing was written for s3://{self.bucket}/{self.key}")
+        client().complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+        )
+        return object_url(self.bucket, self.key)
+
+    def abort(self):
+        client().abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+# A reader still waiting for a writer to open the FIFO is let go with an empty stream
+def _release_reader(fifo_path, reader):
+    while not reader.done():
+        try:
+            os.close(os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK))
+            return
+        except OSError as e:
+            # ENXIO: the reader has not opened its end yet
+            if e.errno != errno.ENXIO:
+                raise
+            time.sleep(0.05)
+
+
+# Run write(output_path) and store what it writes as bucket/key, return the URL.
+# Pass stream=True only for writers that encode the whole video in one pass, e.g.
+# moviepy's write_videofile. With S3_STREAM_UPLOADS on, output_path is then a FIFO
+# that is uploaded part by part while the encode runs. The object is complete right
+# after the writer finishes, and nothing is left at output_path. Such writers must
+# produce output that is never seeked back into; ffmpeg_render.mp4_movflags switches
+# to fragmented MP4 for a FIFO. Segment renders only write during their final
+# stream-copy concat, which leaves no upload time to hide. They stay on the default:
+# a faststart MP4 on disk, uploaded once it is finished.
+def upload_while_writing(write, output_path, bucket, key, stream=False):
+    if not (stream and S3_STREAM_UPLOADS):
+        write(output_path)
+        return upload_file(output_path, bucket, key)
+
+    upload = MultipartUpload(bucket, key)
+    os.mkfifo(output_path)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as reader_pool:
+            reader = reader_pool.submit(upload.read_from, output_path)
+            try:
+                write(output_path)
+            finally:
+                # Writers that failed, or never opened output_path, leave the reader waiting
+                _release_reader(output_path, reader)
+                reader.exception()
+            reader.result()
+        s3_url = upload.complete()
+    except BaseException:
+        upload.abort()
+        raise
+    finally:
+        os.remove(output_path)
+
+    print(f"Streamed {upload.size} bytes to {s3_url}")
+    return s3_url
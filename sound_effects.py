@@ -0,0 +1,75 @@
+import os
+import sys
+import threading
+
+from elevenlabs import ElevenLabs
+
+from asset_store import AssetStore, asset_key, place_file
+from llm_cache import bypass_cache
+
+elevenlabs = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+
+# Set SOUND_EFFECT_CACHE_ENABLED=0 to synthesize every effect again (results are still stored)
+SOUND_EFFECT_CACHE_ENABLED = os.getenv("SOUND_EFFECT_CACHE_ENABLED", "1") == "1"
+SOUND_EFFECT_CACHE_MAX_BYTES = int(os.getenv("SOUND_EFFECT_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+sound_effect_library = AssetStore("sound_effects", max_bytes=SOUND_EFFECT_CACHE_MAX_BYTES)
+
+
+# "Thunder ", "thunder" and "THUNDER" are the same effect
+def normalize_prompt(text):
+    return " ".join(str(text).split()).lower()
+
+
+def sound_effect_key(text, duration_seconds, prompt_influence):
+    return asset_key(prompt=normalize_prompt(text), duration=float(duration_seconds), prompt_influence=float(prompt_influence))
+
+
+# The caller's wording goes to ElevenLabs as is; only the library key is normalized
+def _synthesize(text, duration_seconds, prompt_influence, key):
+    print(f"Generating sound effect for '{text}'...")
+    result = elevenlabs.text_to_sound_effects.convert(
+        text=text,
+        duration_seconds=duration_seconds,
+        prompt_influence=prompt_influence,
+    )
+    return sound_effect_library.put_bytes(key, b"".join(result), ".mp3", meta={"prompt": normalize_prompt(text)})
+
+
+# Write the effect for text to output_path, from the library when it was made before
+def sound_effect(text, output_path, duration_seconds=1, prompt_influence=0.3):
+    key = sound_effect_key(text, duration_seconds, prompt_influence)
+
+    if SOUND_EFFECT_CACHE_ENABLED and not bypass_cache.get():
+        if sound_effect_library.fetch(key, output_path) is not None:
+            print(f"Sound effect for '{text}' reused from library, saved to {output_path}")
+            return output_path
+
+    place_file(_synthesize(text, duration_seconds, prompt_influence, key), output_path)
+    print(f"Audio saved to {output_path}")
+    return output_path
+
+
+# Synthesize the (text, duration_seconds, prompt_influence) effects the library does not have yet
+def prewarm(effects):
+    for text, duration_seconds, prompt_influence in effects:
+        key = sound_effect_key(text, duration_seconds, prompt_influence)
+        if sound_effect_library.get(key):
+            continue
+        try:
+            _synthesize(text, duration_seconds, prompt_influence, key)
+        except Exception as e:
+            print(f"Could not prewarm sound effect '{text}': {e}")
+
+
+# Prewarm at service start without delaying it
+def prewarm_in_background(effects):
+    thread = threading.Thread(target=prewarm, args=(list(effects),), daemon=True)
+    thread.start()
+    return thread
+
+
+# python sound_effects.py thunder explosion "heavy rain" -> one-second effects ready for automatic-se
+if __name__ == "__main__":
+    prewarm((word, 1, 0.3) for word in sys.argv[1:])
+    print(sound_effect_library.stats())
@@ -0,0 +1,104 @@
+'''
+One asyncio process in front of the video-story backend, in place of the ten
+*-wrapper-v1-api.py Flask processes.
+
+Every route appends its injection to the caller's topic, fills in its default
+num_frames and forwards the request to the backend. Requests waiting on the
+backend are coroutines, not threads, and all of them share one pool of
+keep-alive connections to it. The gateway listens on every port the old
+wrappers used, so callers keep their URLs.
+
+    python story_gateway.py
+'''
+
+import asyncio
+import os
+
+import aiohttp
+from aiohttp import web
+
+import http_pool
+
+external_ip = os.getenv("EXTERNAL_IP")
+STORY_BACKEND_URL = os.getenv("STORY_BACKEND_URL", f"http://{external_ip}:7004/video-story")
+# Upper bound on open connections to the backend (each one is a video being rendered)
+GATEWAY_MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+
+# path -> topic injection, default num_frames and the port its old wrapper listened on
+ROUTES = {
+    "/video-story-bizarre": {"injection": " Give bizarre style responses about ", "num_frames": 4, "port": 7032},
+    "/video-story-didyouknow": {"injection": " Give Did you know style responses about ", "num_frames": 4, "port": 7029},
+    "/video-story-facts": {"injection": " Give mind blowing facts about ", "num_frames": 4, "port": 7034},
+    "/video-story-howitsmade": {"injection": " Give How it's made style responses about ", "num_frames": 4, "port": 7030},
+    "/video-story-inventions": {"injection": " Give mind blowing inventions about ", "num_frames": 4, "port": 7033},
+    "/video-story-motivation": {"injection": "Give motivation quotes or information about ", "num_frames": 5, "port": 7027},
+    "/video-story-mystery": {"injection": " Give mystery style responses about ", "num_frames": 4, "port": 7031},
+    "/video-story-news": {"injection": " Make it about the latest, intriguing, fascinating news", "num_frames": 5, "port": 7025},
+    "/video-story-tips": {"injection": " Giveless known tips about ", "num_frames": 5, "port": 7026},
+    "/video-story-whatif": {"injection": " Give What if hypothetical questions about ", "num_frames": 4, "port": 7028},
+}
+# Set GATEWAY_PORTS=7040 to serve every route on one port instead of the old wrapper ports
+GATEWAY_PORTS = [int(port) for port in os.getenv("GATEWAY_PORTS", "").split(",") if port.strip()] or \
+    sorted({route["port"] for route in ROUTES.values()})
+
+
+# Handler for one route of the table
+def story_proxy(route):
+    async def proxy(request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'topic' not in data:
+            return web.json_response({"error": "Missing 'topic' parameter"}, status=400)
+
+        # Other fields ("async", "no_cache", ...) go to the backend untouched
+        payload = dict(data)
+        payload["topic"] = data['topic'] + route["injection"]
+        payload["num_frames"] = data.get('num_frames', route["num_frames"])
+
+        session = request.app["backend"]
+        async with session.post(STORY_BACKEND_URL, json=payload) as response:
+            if 200 <= response.status < 300:
+                return web.json_response(await response.json(content_type=None), status=response.status)
+            details = await response.text()
+
+        print("Error Response:", response.status, details)
+        return web.json_response(
+            {"error": "Failed to retrieve data", "status_code": response.status, "details": details},
+            status=response.status
+        )
+
+    return proxy
+
+
+# The shared backend session lives as long as the app
+async def backend_session(app):
+    connect_timeout, read_timeout = http_pool.SERVICE_TIMEOUT
+    app["backend"] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=GATEWAY_MAX_CONNECTIONS),
+        timeout=aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout),
+    )
+    yield
+    await app["backend"].close()
+
+
+def create_app():
+    app = web.Application()
+    app.cleanup_ctx.append(backend_session)
+    for path, route in ROUTES.items():
+        app.router.add_post(path, story_proxy(route))
+    return app
+
+
+async def serve(app, ports):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    for port in ports:
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        print(f"Story gateway listening on port {port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(create_app(), GATEWAY_PORTS))
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+from PIL import Image
+
+import media_probe
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# Probe the way a pip-only install does: imageio-ffmpeg ships ffmpeg but no ffprobe
+@pytest.fixture
+def without_ffprobe(monkeypatch):
+    monkeypatch.setattr(media_probe, "FFPROBE_BINARY", None)
+    monkeypatch.setattr(media_probe, "_cache", media_probe.OrderedDict())
+
+
+@pytest.mark.parametrize("suffix", [".png", ".jpg"])
+def test_image_dimensions_without_ffprobe(without_ffprobe, tmp_path, suffix):
+    image_path = str(tmp_path / f"frame{suffix}")
+    Image.new("RGB", (64, 48)).save(image_path)
+
+    assert media_probe.dimensions(image_path) == (64, 48)
+    assert media_probe.duration(image_path) is None
+
+
+def test_audio_duration_without_ffprobe(without_ffprobe):
+    assert media_probe.duration(os.path.join(HERE, "sample.mp3")) > 0
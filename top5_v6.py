@@ -4,13 +4,16 @@ import os
 import json
 import ast
 from io import BytesIO
-import requests
 import cv2
-import numpy as np
 from moviepy.editor import ImageClip, concatenate_videoclips
 from moviepy.video.fx.all import resize, crop
-from moviepy.editor import VideoFileClip, AudioFileClip
+from moviepy.editor import VideoFileClip
 import fal_client
+from ffmpeg_render import replace_audio
+from ken_burns import render_ken_burns_video
+from image_store import cached_image, generate_dalle_image
+from llm_cache import chat_completion
+import s3_transfer
 
 # Accepting all environment variables
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -20,13 +23,8 @@ client = openai.OpenAI(api_key=openai_api_key)
 
 # Defining Azure file upload to s3 helper function
 def upload_file_to_s3(file_path, bucket_name, s3_filename):
-    s3 = boto3.client('s3',
-                      region_name=aws_region,
-                      aws_access_key_id=aws_access_key,
-                      aws_secret_access_key=aws_secret_key)
     try:
-        s3.upload_file(file_path, bucket_name, s3_filename)
-        s3_url = f"https://{bucket_name}.s3.{aws_region}.amazonaws.com/{s3_filename}"
+        s3_url = s3_transfer.upload_file(file_path, bucket_name, s3_filename)
         print(f"File uploaded to {s3_url}")
         return s3_url
     except FileNotFoundError:
@@ -38,50 +36,33 @@ def upload_file_to_s3(file_path, bucket_name, s3_filename):
 
 # Generating 10 subject words and metrics using OpenAI GPT-4 API
 def generate_text(topic, num_frames):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+        client,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You generate an object only according to topic"},
             {"role": "user", "content": f"This is the topic {topic}. We are making top {num_frames} list." + " In this list there is a subject and there is a respective discrete (number) metric. For example, if the topic is fastest animals the subjects will be Cheetah, Tiger, Deer and so on and the metrics will be their top speed. So you have to finally only return an object which looks like {'Cheetah' : 'Top Speed : 110', 'Tiger': 'Top Speed : 90'} and so on. Make sure the subjects have max two words and the metric is preferably a number, specific and trustable. Please only return the final object and nothing else "}
-        ]
+        ],
+        parse=ast.literal_eval
     )
-    response = completion.choices[0].message.content
-    return ast.literal_eval(response)
+    return response
 
 def generate_casual_image(subjects, casual_subjects):
     for subject in subjects:
-        resp = client.images.generate(
-            model="dall-e-3",
-            prompt=f"Create a realistic image of this {subject} in a natural location",
-            n=1,
-            size="1024x1024"
-        )
-        image_url = resp.data[0].url
-        print("The image url is ", image_url)
-        casual_subjects.append(image_url)
+        casual_subjects.append(generate_dalle_image(client, f"Create a realistic image of this {subject} in a natural location"))
     return casual_subjects
 
 def generate_action_image(subjects, action_subjects):
     for subject in subjects:
-        resp = client.images.generate(
-            model="dall-e-3",
-            prompt=f"Create a realistic image of this {subject} in action",
-            n=1,
-            size="1024x1024"
-        )
-        image_url = resp.data[0].url
-        print("The image url is ", image_url)
-        action_subjects.append(image_url)
+        action_subjects.append(generate_dalle_image(client, f"Create a realistic image of this {subject} in action"))
     return action_subjects
 
 # Using OpenCV to add numbers to images with a highlighted background
-def add_number_and_name_to_image_cv2(url, number, subject_name):
+def add_number_and_name_to_image_cv2(image_path, number, subject_name):
     output_folder = "images_with_text"
     os.makedirs(output_folder, exist_ok=True)
 
-    response = requests.get(url)
-    image_data = np.asarray(bytearray(response.content), dtype="uint8")
-    img = cv2.imdecode(image_data, cv2.IMREAD_COLOR)
+    img = cv2.imread(image_path)
 
     font_scale = min(img.shape[1], img.shape[0]) / 500
     font_thickness = 2
@@ -103,13 +84,11 @@ def add_number_and_name_to_image_cv2(url, number, subject_name):
     print(f"Image with number {number} and subject '{subject_name}' saved.")
 
 # Using OpenCV to add metrics to images with a highlighted background
-def add_metric_to_image_cv2(url, metric):
+def add_metric_to_image_cv2(image_path, metric):
     output_folder = "action_images_with_metrics"
     os.makedirs(output_folder, exist_ok=True)
 
-    response = requests.get(url)
-    image_data = np.asarray(bytearray(response.content), dtype="uint8")
-    img = cv2.imdecode(image_data, cv2.IMREAD_COLOR)
+    img = cv2.imread(image_path)
 
     font_scale = min(img.shape[1], img.shape[0]) / 800
     font_thickness = 2
@@ -136,44 +115,28 @@ def create_topic_image(topic):
             for log in update.logs:
                 print(log["message"])
 
-    result = fal_client.subscribe(
-        "fal-ai/recraft-v3",
-        arguments={"prompt": topic},
-        with_logs=True,
-        on_queue_update=on_queue_update,
-    )
-    return result['images'][0]['url']
+    def generate():
+        result = fal_client.subscribe(
+            "fal-ai/recraft-v3",
+            arguments={"prompt": topic},
+            with_logs=True,
+            on_queue_update=on_queue_update,
+        )
+        return result['images'][0]['url']
+
+    return cached_image("fal-ai/recraft-v3", topic, generate)
 
 # Function to convert image to a short video clip
-def create_short_video_from_image(image_url, output_path, duration=0.3):
-    response = requests.get(image_url)
-    image_data = np.asarray(bytearray(response.content), dtype="uint8")
-    img = cv2.imdecode(image_data, cv2.IMREAD_COLOR)
+def create_short_video_from_image(image_path, output_path, duration=0.3):
+    img = cv2.imread(image_path)
     cv2.imwrite("temp_image.png", img)
     
     clip = ImageClip("temp_image.png").set_duration(duration)
     clip.write_videofile(output_path, fps=24)
 
-# Function to add pan and zoom effect on individual images
-def add_pan_zoom_effect(image_path, duration=1.5, zoom_factor=1.1):
-    clip = ImageClip(image_path).set_duration(duration)
-    w, h = clip.size
-    new_w, new_h = int(w * zoom_factor), int(h * zoom_factor)
-
-    zoomed_clip = clip.resize(newsize=(new_w, new_h))
-
-    def pan_zoom(get_frame, t):
-        frame = get_frame(t)
-        h, w, _ = frame.shape
-        x_shift = int((new_w - w) * (t / duration))
-        y_shift = int((new_h - h) * (t / duration))
-        return frame[y_shift:y_shift + h, x_shift:x_shift + w]
-
-    return zoomed_clip.fl(pan_zoom)
-
 # Function to create alternating final video
 def create_alternating_video(casual_folder, action_folder, output_video_path, duration=1.5):
-    clips = []
+    ordered_images = []
     casual_images = sorted([f for f in os.listdir(casual_folder) if f.endswith((".png", ".jpg", ".jpeg"))])
     action_images = sorted([f for f in os.listdir(action_folder) if f.endswith((".png", ".jpg", ".jpeg"))])
     
@@ -181,27 +144,16 @@ def create_alternating_video(casual_folder, action_folder, output_video_path, du
         casual_path = os.path.join(casual_folder, casual_img)
         action_path = os.path.join(action_folder, action_img)
         
-        casual_clip = add_pan_zoom_effect(casual_path, duration)
-        action_clip = add_pan_zoom_effect(action_path, duration)
-        
-        clips.append(casual_clip)
-        clips.append(action_clip)
+        ordered_images.append(casual_path)
+        ordered_images.append(action_path)
 
-    final_video = concatenate_videoclips(clips, method="compose")
-    final_video.write_videofile(output_video_path, codec="libx264", fps=24)
+    # Every image is its own pan/zoom segment, rendered one per core and joined without re-encoding
+    render_ken_burns_video(ordered_images, output_video_path, duration)
 
 # Function to add audio to video
 def add_audio_to_video(video_path, audio_path, output_path):
-    video = VideoFileClip(video_path)
-    audio = AudioFileClip(audio_path)
-
-    if audio.duration > video.duration:
-        audio = audio.subclip(0, video.duration)
-
-    video = video.set_audio(audio)
-    video.write_videofile(output_path, codec="libx264", audio_codec="aac")
-    video.close()
-    audio.close()
+    # Audio is trimmed to the video length; the video stream is copied, not re-encoded
+    replace_audio(video_path, audio_path, output_path)
 
 # Main script execution
 topic = input("Enter the topic ")
@@ -222,15 +174,15 @@ metrics.reverse()
 final_casual_subjects = generate_casual_image(subjects, casual_subjects)
 final_action_subjects = generate_action_image(subjects, action_subjects)
 
-for i, (url, subject) in enumerate(zip(final_casual_subjects, subjects), start=1):
-    add_number_and_name_to_image_cv2(url, i, subject)
+for i, (image_path, subject) in enumerate(zip(final_casual_subjects, subjects), start=1):
+    add_number_and_name_to_image_cv2(image_path, i, subject)
 
-for url, metric in zip(final_action_subjects, metrics):
-    add_metric_to_image_cv2(url, metric)
+for image_path, metric in zip(final_action_subjects, metrics):
+    add_metric_to_image_cv2(image_path, metric)
 
 # Create topic image and short video
-topic_image_url = create_topic_image(topic)
-create_short_video_from_image(topic_image_url, "intro_video.mp4", duration=0.3)
+topic_image_path = create_topic_image(topic)
+create_short_video_from_image(topic_image_path, "intro_video.mp4", duration=0.3)
 
 # Create final video with pan and zoom effects
 casual_images_folder = "images_with_text"
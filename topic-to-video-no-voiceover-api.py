@@ -4,19 +4,24 @@ import time
 import os
 import uuid
 from moviepy.editor import *
-import googleapiclient.discovery
 import yt_dlp
-import boto3
+from ffmpeg_render import mp4_movflags
+from youtube_cache import broll_options, broll_span, cached_download, cached_search, youtube_client
+import handoff
 import nltk
 from nltk.corpus import stopwords
 from collections import Counter
 import re
-import requests
+import http_pool
+from llm_cache import chat_completion, register_cache_bypass
+from workspace import Workspace
 
 nltk.download("stopwords")
 stop_words = set(stopwords.words("english"))
 
 app = Flask(__name__)
+register_cache_bypass(app)
+http_pool.register_http_stats_route(app)
 
 # Retrieve API keys from environment variables
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -26,55 +31,37 @@ aws_secret_key = os.getenv("AWS_SECRET_KEY")
 s3_bucket_name = os.getenv("S3_BUCKET_NAME")
 aws_region = os.getenv("AWS_REGION")
 external_ip = os.getenv("EXTERNAL_IP")
+caption_api_url = f"http://{external_ip}:7020/caption_video"
 
 # Initialize OpenAI client
 client = openai.OpenAI()
 
-# S3 client initialization
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key,
-    region_name=aws_region
-)
-
-
-def upload_to_s3(file_path, unique_id):
-    s3_key = f"videos/{unique_id}.mp4"
-    try:
-        s3_client.upload_file(file_path, s3_bucket_name, s3_key)
-        s3_url = f"https://{s3_bucket_name}.s3.{aws_region}.amazonaws.com/{s3_key}"
-        return s3_url
-    except Exception as e:
-        print(f"Error uploading to S3: {str(e)}")
-        return None
-        
 def generate_text(topic, num_frames):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+      client,
       model="gpt-4o-mini",
       messages=[
         {"role": "system", "content": "You are a super creative non-fiction story writer"},
         {"role": "user", "content": "Your job is to generate "+ str(num_frames) + " single-line sentences which will be used in a video story about the topic "+ str(topic)+ ". Please give a numbered list only like 1. 2. 3. and so on."}
       ]
     )
-    response = completion.choices[0].message.content
     sentences = re.split(r'\d+\.\s', response)[1:]
     cleaned_sentences = [sentence.strip().replace("\n", "") for sentence in sentences]
     return cleaned_sentences
     
 def extract_subject(text):
-    completion = client.chat.completions.create(
+    response = chat_completion(
+      client,
       model="gpt-4o-mini",
       messages=[
         {"role": "system", "content": "You only return subject of the sentence"},
         {"role": "user", "content": f"You simply return the subject of the sentence {text} and nothing else"}
       ]
     )
-    response = completion.choices[0].message.content
     return response
 
 def youtube_search(query, max_results=5):
-    youtube = googleapiclient.discovery.build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
+    youtube = youtube_client(YOUTUBE_API_KEY)
     request = youtube.search().list(
         part="snippet",
         q=str(query) + " B roll",
@@ -102,58 +89,58 @@ def youtube_search(query, max_results=5):
 
     return video_links
 
-def download_video(url, output_folder, unique_id):
+def download_video(url, output_folder, unique_id, seconds=None):
     try:
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
         
         ydl_opts = {
-            'format': 'mp4',
+            **broll_options(seconds),  # Only the span we use, at most BROLL_MAX_HEIGHT
             'outtmpl': os.path.join(output_folder, f'{unique_id}.%(ext)s'),
             'ignoreerrors': True,
-            'merge_output_format': 'mp4',
         }
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            info = ydl.extract_info(url, download=True)
+            if not info:
+                print(f"Failed to download video from: {url}")
+                return None
+            file_path = ydl.prepare_filename(info)
         
         print(f"Downloaded video from: {url}")
+        return file_path
     
     except Exception as e:
         print(f"Error downloading video: {str(e)}")
+        return None
 
 
-def search_and_download(query, max_results=1, output_folder="downloaded_videos", unique_id=None):
-    video_urls = youtube_search(query, max_results)
+# Return the path of the first search result that downloads successfully
+def search_and_download(query, output_folder, max_results=1, unique_id=None, seconds=None):
+    # Known queries and clips come from local disk without touching YouTube
+    video_urls = cached_search(query, max_results, youtube_search)
     for url in video_urls:
-        download_video(url, output_folder, unique_id)
+        file_path = cached_download(url, output_folder, unique_id, download_video, seconds)
+        if file_path and os.path.exists(file_path):
+            return file_path
+    return None
 
-def download_video_for_text(text, unique_id):
+# Fetch B-roll for text, just long enough to cover `duration` seconds
+def download_video_for_text(text, unique_id, workspace, duration):
     keyword = extract_subject(text)
     print("The keyword is ", keyword)
-    search_and_download(keyword, max_results=1, output_folder="downloaded_videos", unique_id=unique_id)
-
-def create_video(clip_info):
-    video_folder = "downloaded_videos"
-    output_folder = "generated_video"
-
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    return search_and_download(keyword, workspace.folder("downloaded_videos"), max_results=1, unique_id=unique_id,
+                               seconds=broll_span(duration))
 
+def create_video(clip_info, output_path):
     clips = []
 
     for info in clip_info:
-        unique_id = info['unique_id']
+        video_file = info['video_path']
         duration = info['duration']
 
-        video_file = None
-        for file in os.listdir(video_folder):
-            if file.startswith(unique_id):
-                video_file = os.path.join(video_folder, file)
-                break
-
         if video_file is None:
-            print(f"No video file found for {unique_id}")
+            print(f"No video file found for {info['unique_id']}")
             continue
 
         video_clip = VideoFileClip(video_file)
@@ -163,8 +150,8 @@ def create_video(clip_info):
 
     final_clip = concatenate_videoclips(clips, method='compose')
 
-    output_path = os.path.join(output_folder, "final_video.mp4")
-    final_clip.write_videofile(output_path, fps=24, codec='libx264', audio_codec='aac')
+    final_clip.write_videofile(output_path, fps=24, codec='libx264', audio_codec='aac',
+                               ffmpeg_params=mp4_movflags(output_path))
 
     print(f"Video saved as {output_path}")
 
@@ -183,36 +170,44 @@ def video_story():
     except ValueError:
         return jsonify({'error': 'num_frames must be an integer'}), 400
 
-    generated_array = generate_text(topic, num_frames)
-    
-    clip_info = []
-    
-    for text in generated_array:
-        unique_id = str(uuid.uuid4())
-        download_video_for_text(text, unique_id)
-        clip_info.append({
-            'unique_id': unique_id,
-            'duration': 5  # Default to 5 seconds or adjust as needed
-        })
-
-    create_video(clip_info)
+    # Scratch files live in a per-request workspace that is removed afterwards
+    with Workspace("no-voiceover") as workspace:
+        generated_array = generate_text(topic, num_frames)
+
+        clip_info = []
+
+        for text in generated_array:
+            unique_id = str(uuid.uuid4())
+            duration = 5  # Default to 5 seconds or adjust as needed
+            video_path = download_video_for_text(text, unique_id, workspace, duration)
+            clip_info.append({
+                'unique_id': unique_id,
+                'video_path': video_path,
+                'duration': duration
+            })
+
+        # Captioning reads the video from disk when it runs on this node, from S3 otherwise
+        video = handoff.send_video(
+            lambda output_path: create_video(clip_info, output_path), caption_api_url,
+            workspace.path("generated_video", "final_video.mp4"), s3_bucket_name, f"videos/{uuid.uuid4()}.mp4",
+            stream=True
+        )
 
-    video_file_path = os.path.join("generated_video", "final_video.mp4")
-    
-    s3_url = upload_to_s3(video_file_path, "final_video")
+    # A caller on this node takes the captioned video as a local path too
+    if handoff.wants_local_reply(data):
+        video["handoff"] = "local"
 
-    if s3_url:
-        response = requests.post(
-            f"http://{external_ip}:7020/caption_video",
-            headers={"Content-Type": "application/json"},
-            json={"video_url": s3_url}
-        )
+    response = http_pool.post(
+        caption_api_url,
+        headers={"Content-Type": "application/json"},
+        json=video,
+        timeout=http_pool.SERVICE_TIMEOUT
+    )
 
-        if response.status_code == 200:
-            captioned_video_url = response.json().get("video_url")
-            return jsonify({"video_url": captioned_video_url}), 200
-        else:
-            return jsonify({"error": "Failed to send video to caption endpoint"}), 500
+    if response.status_code == 200:
+        return jsonify(handoff.video_fields(response.json())), 200
+    else:
+        return jsonify({"error": "Failed to send video to caption endpoint"}), 500
 
         
 if __name__ == '__main__':
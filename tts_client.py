@@ -0,0 +1,64 @@
+import os
+import http_pool
+import media_probe
+from asset_store import AssetStore, asset_key
+from llm_cache import bypass_cache
+
+elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
+
+# Voice and settings shared by the story services
+DEFAULT_VOICE_ID = "TlLWC5O5AUzxAg7ysFZB"
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.1,
+    "similarity_boost": 0
+}
+# (connect, read) timeouts for the synthesis call
+TTS_TIMEOUT = (10, 120)
+# Synthesized audio is kept on local disk and reused for identical requests,
+# except for requests with no_cache (their audio is still stored)
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1") == "1"
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+tts_cache = AssetStore("tts", max_bytes=TTS_CACHE_MAX_BYTES)
+
+
+# Synthesize text with ElevenLabs and stream the MP3 straight to output_path.
+# The text-to-speech response already is the audio, so one request replaces
+# the old submit_text -> get_history_item_id -> create_audiofile round-trips.
+# The same voice, text and settings always give the same file from the local
+# cache, without calling ElevenLabs and with the duration already known.
+def synthesize(text, output_path, voice_id=DEFAULT_VOICE_ID, voice_settings=None):
+    voice_settings = voice_settings or DEFAULT_VOICE_SETTINGS
+    key = asset_key(voice_id=voice_id, text=text, voice_settings=voice_settings)
+
+    if TTS_CACHE_ENABLED and not bypass_cache.get():
+        cached = tts_cache.fetch(key, output_path)
+        if cached:
+            print(f"{output_path} reused from TTS cache, duration: {cached['duration']} seconds")
+            return output_path, cached["duration"]
+
+    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "audio/mpeg",
+        "xi-api-key": elevenlabs_api_key
+    }
+    data = {
+        "text": text,
+        "voice_settings": voice_settings
+    }
+
+    with http_pool.post(url, headers=headers, json=data, stream=True, timeout=TTS_TIMEOUT) as response:
+        if response.status_code != 200:
+            raise Exception(f"Error {response.status_code}: {response.content}")
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        with open(output_path, "wb") as audio_file:
+            for chunk in response.iter_content(chunk_size=8192):
+                audio_file.write(chunk)
+
+    duration = media_probe.duration(output_path)
+    if TTS_CACHE_ENABLED:
+        tts_cache.put(key, output_path, meta={"duration": duration})
+    print(f"{output_path} saved successfully, duration: {duration} seconds")
+    return output_path, duration
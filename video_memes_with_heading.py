@@ -1,5 +1,6 @@
 import fal_client
 import asyncio
+from image_store import cached_image
 
 
 
@@ -10,16 +11,20 @@ def on_queue_update(update):
            print(log["message"])
 
 def create_image(prompt):
-    result = fal_client.subscribe(
-        "fal-ai/recraft-v3",
-        arguments={
-            "prompt": prompt
-        },
-        with_logs=True,
-        on_queue_update=on_queue_update,
-    )
-
-    image_url = result['images'][0]['url']
+    def generate():
+        result = fal_client.subscribe(
+            "fal-ai/recraft-v3",
+            arguments={
+                "prompt": prompt
+            },
+            with_logs=True,
+            on_queue_update=on_queue_update,
+        )
+        return result['images'][0]['url']
+
+    image_path = cached_image("fal-ai/recraft-v3", prompt, generate)
+    # A stored image may outlive its provider URL, so kling gets a fresh upload of it
+    image_url = fal_client.upload_file(image_path)
     print("Image URL:", image_url)
     return image_url
 
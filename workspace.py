@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import uuid
+
+# Every request gets its own scratch directory under this root
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", os.path.join(tempfile.gettempdir(), "all_apis_workspaces"))
+# Set KEEP_WORKSPACES=1 to leave scratch directories behind for debugging
+KEEP_WORKSPACES = os.getenv("KEEP_WORKSPACES", "0") == "1"
+
+
+# Isolated scratch directory for one pipeline run.
+# Stages ask it for file paths and pass those paths along explicitly,
+# so nothing is discovered by listing or cleaning shared folders.
+class Workspace:
+    def __init__(self, prefix="request"):
+        os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+        self.root = tempfile.mkdtemp(prefix=f"{prefix}-", dir=WORKSPACE_ROOT)
+
+    # Return a subfolder of the workspace, creating it if needed
+    def folder(self, name):
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # Return a fixed file path inside the workspace, e.g. path("generated_video", "final_video.mp4")
+    def path(self, *parts):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    # Return a unique file path inside a subfolder
+    def new_file(self, folder, suffix):
+        return os.path.join(self.folder(folder), f"{uuid.uuid4()}{suffix}")
+
+    def cleanup(self):
+        if KEEP_WORKSPACES:
+            print(f"Keeping workspace {self.root}")
+            return
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
@@ -0,0 +1,116 @@
+import json
+import math
+import os
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import googleapiclient.discovery
+from yt_dlp.utils import download_range_func
+
+from asset_store import AssetStore, asset_key, place_file
+from ffmpeg_render import FFMPEG_BINARY
+from llm_cache import bypass_cache
+
+# Set YOUTUBE_CACHE_ENABLED=0 to search and download every time (results are still stored)
+YOUTUBE_CACHE_ENABLED = os.getenv("YOUTUBE_CACHE_ENABLED", "1") == "1"
+# Search results are refreshed after this many seconds (default 7 days)
+YOUTUBE_SEARCH_TTL = int(os.getenv("YOUTUBE_SEARCH_TTL", str(7 * 24 * 3600)))
+BROLL_CACHE_MAX_BYTES = int(os.getenv("BROLL_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+# B-roll is never fetched taller than this, matching the videos we render
+BROLL_MAX_HEIGHT = int(os.getenv("BROLL_MAX_HEIGHT", "720"))
+# Extra seconds fetched past the narration, and the shortest span worth fetching,
+# so a stored clip usually covers the next sentence that needs it too
+BROLL_MARGIN = 1.0
+BROLL_MIN_SECONDS = 10
+
+search_results = AssetStore("youtube_search", max_bytes=64 * 1024 ** 2, ttl=YOUTUBE_SEARCH_TTL)
+broll_clips = AssetStore("broll", max_bytes=BROLL_CACHE_MAX_BYTES)
+
+_clients = threading.local()
+
+
+# Data API client, built once per thread instead of once per search
+# (the httplib2 connection underneath is not thread-safe)
+def youtube_client(api_key):
+    client = getattr(_clients, "youtube", None)
+    if client is None:
+        client = googleapiclient.discovery.build("youtube", "v3", developerKey=api_key)
+        _clients.youtube = client
+    return client
+
+
+def _use_cache():
+    return YOUTUBE_CACHE_ENABLED and not bypass_cache.get()
+
+
+# "Snow  Leopard." and "snow leopard" are the same search
+def normalize_query(query):
+    return " ".join(str(query).lower().replace(".", " ").split())
+
+
+def video_id(url):
+    parsed = urlparse(url)
+    if parsed.hostname == "youtu.be":
+        return parsed.path.lstrip("/")
+    return parse_qs(parsed.query).get("v", [url])[0]
+
+
+# Video URLs for query, from the search cache when this query was searched before.
+# search(query, max_results) runs the actual Data API search. Empty results are not
+# stored, so a failed or unlucky search is tried again next time.
+def cached_search(query, max_results, search):
+    key = asset_key(query=normalize_query(query), max_results=max_results)
+
+    if _use_cache():
+        found = search_results.get(key)
+        if found:
+            with open(found[0]) as results_file:
+                video_links = json.load(results_file)
+            print(f"Search results for '{query}' reused from cache: {video_links}")
+            return video_links
+
+    video_links = search(query, max_results)
+    if video_links:
+        search_results.put_bytes(key, json.dumps(video_links).encode("utf-8"), ".json", meta={"query": normalize_query(query)})
+    return video_links
+
+
+# Seconds of B-roll to fetch for a clip that has to cover `duration` seconds
+def broll_span(duration):
+    return math.ceil(max(duration + BROLL_MARGIN, BROLL_MIN_SECONDS))
+
+
+# yt-dlp options that fetch only the first `seconds` of a video (all of it when None)
+# at no more than BROLL_MAX_HEIGHT. Plain "mp4" is the fallback for videos that have
+# nothing under the cap.
+def broll_options(seconds=None):
+    height = BROLL_MAX_HEIGHT
+    options = {
+        "format": f"bv*[height<={height}][ext=mp4]+ba[ext=m4a]/b[height<={height}][ext=mp4]/b[height<={height}]/mp4",
+        "merge_output_format": "mp4",
+        "ffmpeg_location": FFMPEG_BINARY,
+    }
+    if seconds:
+        options["download_ranges"] = download_range_func(None, [(0, seconds)])
+    return options
+
+
+# Put the clip for url at output_folder/<unique_id>.<ext> and return its path, or None.
+# download(url, output_folder, unique_id, seconds) runs yt-dlp and is only called when
+# no stored clip of this video covers `seconds`. Clips are stored by video id and
+# height cap with the span they cover, and evicted least recently used.
+def cached_download(url, output_folder, unique_id, download, seconds=None):
+    key = asset_key(video_id=video_id(url), max_height=BROLL_MAX_HEIGHT)
+
+    if _use_cache():
+        found = broll_clips.get(key)
+        stored_seconds = found[1].get("seconds") if found else None
+        if found and (stored_seconds is None or (seconds and stored_seconds >= seconds)):
+            target_path = os.path.join(output_folder, unique_id + os.path.splitext(found[0])[1])
+            print(f"Clip {video_id(url)} reused from B-roll cache")
+            return place_file(found[0], target_path)
+
+    file_path = download(url, output_folder, unique_id, seconds)
+    if file_path and os.path.exists(file_path):
+        broll_clips.put(key, file_path, meta={"url": url, "seconds": seconds})
+    return file_path